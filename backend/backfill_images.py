@@ -0,0 +1,96 @@
+"""
+สร้าง thumbnail / medium ให้ item ที่อัปโหลดก่อนมีภาพย่อ (thumbnail_data IS NULL)
+item ใหม่ได้ภาพย่อตอน ingest อยู่แล้ว ส่วน GET /api/items/{id}/image/{variant} ก็สร้างให้ทีละชิ้นถ้ายังไม่มี
+สคริปต์นี้ทำล่วงหน้าทั้งหมดเพื่อไม่ให้ request แรกของแต่ละ item ช้า
+
+- อ่านทีละ batch เรียงตาม id (keyset: id > id ล่าสุด) ไม่ค้าง cursor ยาว
+- เขียนกลับด้วย bulk UPDATE (executemany) ต่อ batch รันซ้ำได้ แถวที่ทำแล้วจะถูกข้าม
+- --force สร้างใหม่ทุกแถว (เช่นหลังเปลี่ยน THUMBNAIL_SIZE / DERIVATIVE_FORMAT)
+
+รัน (จากโฟลเดอร์ backend):
+    python -m backfill_images --batch-size 32
+"""
+import argparse
+import os
+import sys
+import time
+
+from sqlalchemy import bindparam, select
+
+import models
+from database import engine
+from imaging import DERIVATIVE_FORMAT, MEDIUM_SIZE, THUMBNAIL_SIZE, make_derivatives
+
+
+def derive_rows(rows):
+    """rows = [(id, image_data, original_image_data)] คืน list ของ dict สำหรับ bulk UPDATE
+    แถวที่เปิดภาพไม่ได้จะถูกข้าม"""
+    params = []
+    for item_id, image_data, original_data in rows:
+        if not image_data and not original_data:
+            continue
+        try:
+            thumbnail, medium = make_derivatives(image_data or original_data, original_data)
+        except Exception as e:
+            print(f"[backfill] skip item {item_id}: cannot open image ({e})")
+            continue
+        # _source_size ใช้แค่คำนวณขนาดที่ประหยัดได้ (ไม่ได้ bind ใน UPDATE)
+        params.append({"_id": item_id, "_thumbnail": thumbnail, "_medium": medium,
+                       "_source_size": len(image_data or original_data)})
+    return params
+
+
+def backfill(batch_size: int, force: bool = False, limit: int = None) -> int:
+    table = models.Item.__table__
+    update = (
+        table.update()
+        .where(table.c.id == bindparam("_id"))
+        .values(thumbnail_data=bindparam("_thumbnail"), medium_data=bindparam("_medium"))
+    )
+
+    print(f"[backfill] thumbnail={THUMBNAIL_SIZE} medium={MEDIUM_SIZE} format={DERIVATIVE_FORMAT} "
+          f"batch={batch_size} force={force}")
+    start = time.perf_counter()
+    last_id = 0
+    done = 0
+    saved_bytes = 0
+    while limit is None or done < limit:
+        query = (
+            select(table.c.id, table.c.image_data, table.c.original_image_data)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size if limit is None else min(batch_size, limit - done))
+        )
+        if not force:
+            query = query.where(table.c.thumbnail_data.is_(None))
+        with engine.connect() as conn:
+            rows = [tuple(row) for row in conn.execute(query)]
+        if not rows:
+            break
+
+        params = derive_rows(rows)
+        if params:
+            with engine.begin() as conn:
+                conn.execute(update, params)
+        last_id = rows[-1][0]
+        done += len(params)
+        saved_bytes += sum(p["_source_size"] - len(p["_thumbnail"]) for p in params)
+        rate = done / (time.perf_counter() - start)
+        print(f"[backfill] {done} items (last id {last_id}) {rate:.1f} items/s")
+
+    print(f"[backfill] done: {done} items in {time.perf_counter() - start:.1f}s "
+          f"(thumbnails {saved_bytes / 1024 / 1024:.1f}MB smaller than the images they replace in lists)")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate thumbnail/medium derivatives for existing items")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("BACKFILL_BATCH_SIZE", "32")))
+    parser.add_argument("--limit", type=int, default=None, help="stop after N items (for trial runs)")
+    parser.add_argument("--force", action="store_true", help="regenerate items that already have derivatives")
+    args = parser.parse_args(argv)
+    sys.exit(backfill(max(1, args.batch_size), args.force, args.limit))
+
+
+if __name__ == "__main__":
+    main()
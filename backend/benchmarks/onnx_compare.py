@@ -0,0 +1,174 @@
+"""
+เทียบ CLIP / YOLOv8 แบบ torch float32 กับ ONNX Runtime (float32 และ int8)
+
+- ความแม่น: cosine similarity ระหว่าง embedding ของ torch กับ onnx ต่อรายการ
+  และ top-1 agreement ของการค้นหา text -> image บนชุดตัวอย่างเดียวกัน
+- YOLO: จำนวนกล่อง / label ที่ตรงกับ torch
+- ความเร็ว: p50 / p95 ต่อ batch ของแต่ละ backend
+
+รัน (จากโฟลเดอร์ backend หลัง python -m onnx_backend --quantize):
+    python -m benchmarks.onnx_compare --images path/to/sample_images --output onnx_compare.json
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+SAMPLE_TEXTS = [
+    "black wallet", "red backpack", "iphone with blue case", "car keys", "silver watch",
+    "student id card", "white earphones", "umbrella", "laptop charger", "water bottle",
+]
+
+
+def _load_images(folder: str, limit: int):
+    paths = sorted(
+        p for p in glob.glob(os.path.join(folder, "*")) if p.lower().endswith((".jpg", ".jpeg", ".png"))
+    )[:limit] if folder else []
+    if paths:
+        return [Image.open(p).convert("RGB") for p in paths]
+    # ไม่มีภาพตัวอย่าง: ใช้ภาพสุ่ม (เทียบ embedding ได้ แต่ผล YOLO จะว่าง)
+    rng = np.random.default_rng(0)
+    return [Image.fromarray(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)) for _ in range(limit)]
+
+
+def _timed(fn, repeats: int):
+    samples = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    arr = np.asarray(samples) * 1000.0
+    return result, {"p50_ms": round(float(np.percentile(arr, 50)), 3),
+                    "p95_ms": round(float(np.percentile(arr, 95)), 3)}
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _clip_encoders(model, processor, backend: str):
+    import torch
+
+    def inputs(**kwargs):
+        if backend == "torch":
+            return processor(return_tensors="pt", **kwargs)
+        return dict(processor(return_tensors="np", **kwargs))
+
+    def to_numpy(x):
+        return x if isinstance(x, np.ndarray) else x.cpu().numpy()
+
+    def encode_text(texts):
+        batch = inputs(text=texts, padding=True)
+        with torch.no_grad():
+            return to_numpy(model.get_text_features(input_ids=batch["input_ids"], attention_mask=batch["attention_mask"]))
+
+    def encode_images(images):
+        batch = inputs(images=images)
+        with torch.no_grad():
+            return to_numpy(model.get_image_features(pixel_values=batch["pixel_values"]))
+
+    return encode_text, encode_images
+
+
+def compare_clip(images, repeats: int):
+    import model_registry
+    import onnx_backend
+
+    torch_model, processor = model_registry.load_torch_clip()
+    torch_model = torch_model.to("cpu")
+    variants = {"torch": torch_model}
+    for quantized in (False, True):
+        name = "onnx_int8" if quantized else "onnx_fp32"
+        try:
+            variants[name] = onnx_backend.OnnxClip(quantized=quantized)
+        except FileNotFoundError as e:
+            print(f"[compare] skip {name}: {e}")
+
+    report = {}
+    reference = None
+    for name, model in variants.items():
+        encode_text, encode_images = _clip_encoders(model, processor, "torch" if name == "torch" else "onnx")
+        text_embs, text_latency = _timed(lambda: encode_text(SAMPLE_TEXTS), repeats)
+        image_embs, image_latency = _timed(lambda: encode_images(images), repeats)
+        text_embs, image_embs = _normalize(text_embs), _normalize(image_embs)
+        entry = {"text_batch": text_latency, "image_batch": image_latency}
+        if reference is None:
+            reference = (text_embs, image_embs)
+        else:
+            text_cos = np.sum(text_embs * reference[0], axis=1)
+            image_cos = np.sum(image_embs * reference[1], axis=1)
+            top1 = np.argmax(text_embs @ image_embs.T, axis=1)
+            top1_ref = np.argmax(reference[0] @ reference[1].T, axis=1)
+            entry.update({
+                "text_cosine_min": round(float(text_cos.min()), 5),
+                "text_cosine_mean": round(float(text_cos.mean()), 5),
+                "image_cosine_min": round(float(image_cos.min()), 5),
+                "image_cosine_mean": round(float(image_cos.mean()), 5),
+                "top1_agreement": round(float(np.mean(top1 == top1_ref)), 4),
+            })
+        report[name] = entry
+        print(f"[compare] clip {name}: {entry}")
+    return report
+
+
+def compare_yolo(images, repeats: int):
+    from ultralytics import YOLO
+    import model_registry
+    import onnx_backend
+
+    variants = {"torch": model_registry.load_torch_yolo()}
+    for quantized in (False, True):
+        path = onnx_backend.onnx_path("yolo", quantized)
+        if os.path.exists(path):
+            variants["onnx_int8" if quantized else "onnx_fp32"] = YOLO(path, task="detect")
+
+    def detect(model):
+        out = []
+        for image in images:
+            result = model.predict(image, verbose=False)[0]
+            out.append(sorted(result.names[int(c)] for c in result.boxes.cls.tolist()))
+        return out
+
+    report = {}
+    reference = None
+    for name, model in variants.items():
+        labels, latency = _timed(lambda: detect(model), repeats)
+        entry = {"all_images": latency, "boxes": int(sum(len(l) for l in labels))}
+        if reference is None:
+            reference = labels
+        else:
+            entry["label_agreement"] = round(float(np.mean([a == b for a, b in zip(labels, reference)])), 4)
+        report[name] = entry
+        print(f"[compare] yolo {name}: {entry}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare torch vs ONNX Runtime CLIP / YOLOv8")
+    parser.add_argument("--images", default=None, help="folder of sample jpg/png images")
+    parser.add_argument("--limit", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--models", default="clip,yolo")
+    parser.add_argument("--output", default="onnx_compare.json")
+    args = parser.parse_args(argv)
+
+    images = _load_images(args.images, args.limit)
+    report = {"images": len(images)}
+    if "clip" in args.models:
+        report["clip"] = compare_clip(images, args.repeats)
+    if "yolo" in args.models:
+        report["yolo"] = compare_yolo(images, args.repeats)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[compare] wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
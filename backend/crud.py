@@ -1,5 +1,5 @@
 import base64
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, joinedload, undefer
 import models
 import re
 from models import User, Item, Chat, Message
@@ -8,9 +8,17 @@ import bcrypt
 import io
 from fastapi import Depends, HTTPException, Request, UploadFile, Cookie
 from typing import Optional, List
-from utils import get_text_embedding, get_image_embedding
+from utils import get_text_embedding, get_image_embedding, l2_normalize
+from model_registry import EMBEDDING_MODEL_VERSION
 from datetime import datetime
 from database import get_db
+import os
+import threading
+import time
+from sqlalchemy import func
+import vector_index
+from cache import LRUCache
+from imaging import make_derivatives, render_boxed, sniff_media_type
 
 # ===========================
 # ฟังก์ชันจัดการ User
@@ -79,10 +87,18 @@ def create_item(
     boxed_image_data: Optional[bytes] = None,
     image_emb: Optional[list] = None,
     original_image_data: Optional[bytes] = None,
+    text_emb: Optional[list] = None,
+    detections: Optional[list] = None,
+    thumbnail_data: Optional[bytes] = None,
+    medium_data: Optional[bytes] = None,
 ) -> Item:
-    text_emb = get_text_embedding(item.title).tolist()
+    if text_emb is None:
+        text_emb = get_text_embedding(item.title)
     if image_emb is None:
-        image_emb = get_image_embedding(image_bytes).tolist()
+        image_emb = get_image_embedding(image_bytes)
+    # เก็บเป็น unit vector เสมอ (ค้นหาด้วย inner product ดู models.EMBEDDING_OPS)
+    text_emb = l2_normalize(text_emb).tolist()
+    image_emb = l2_normalize(image_emb).tolist()
 
     db_item = Item(
         title=item.title,
@@ -90,21 +106,153 @@ def create_item(
         category=item.category,
         image_data=image_bytes,
         boxed_image_data=boxed_image_data,
+        detections=detections,
+        thumbnail_data=thumbnail_data,
+        medium_data=medium_data,
         original_image_data=original_image_data,
         image_filename=image_filename,
         image_content_type=image_content_type,
         user_id=user_id,
         text_embedding=text_emb,
         image_embedding=image_emb,
+        embedding_model_version=EMBEDDING_MODEL_VERSION,
     )
     db.add(db_item)
     db.commit()
     db.refresh(db_item)
+    vector_index.add_item(db_item)
+    bump_items_generation()
     return db_item
 
 
-def get_items(db: Session, type_filter: Optional[str] = None) -> List[Item]:
+# ===========================
+# generation ของตาราง items
+# ===========================
+# เพิ่มทุกครั้งที่มี item ถูกสร้าง/ลบ cache ที่อ้างอิง generation เก่าจะไม่ถูกใช้อีก
+# นับแยกต่อ process: การเปลี่ยนจาก process อื่น (upload worker แยก / uvicorn หลาย worker)
+# ถูกจับได้จาก sync_items ซึ่งเทียบ max(id)/count(*) ทุก ITEMS_SYNC_SECONDS
+items_generation = 0
+ITEMS_SYNC_SECONDS = float(os.getenv("ITEMS_SYNC_SECONDS", "2"))
+_items_state = None  # (max id, จำนวน item) ครั้งล่าสุดที่ sync
+_items_synced_at = 0.0
+_items_sync_lock = threading.Lock()
+
+def bump_items_generation():
+    global items_generation
+    items_generation += 1
+
+
+def items_sync_due() -> bool:
+    return time.monotonic() - _items_synced_at >= ITEMS_SYNC_SECONDS
+
+
+def sync_items(db: Session):
+    """ดึง item ที่ process อื่นสร้างเข้า vector_index และ bump generation ถ้าตาราง items เปลี่ยน"""
+    global _items_state, _items_synced_at
+    with _items_sync_lock:
+        if not items_sync_due():
+            return
+        _items_synced_at = time.monotonic()
+        max_id, count = db.query(func.max(Item.id), func.count(Item.id)).one()
+        if vector_index.ENABLED and (max_id or 0) > vector_index.max_loaded_id:
+            loaded = vector_index.load_new(db)
+            if loaded:
+                print(f"🔄 Embedding index: +{loaded} items from other processes")
+        state = (max_id or 0, count)
+        if _items_state is not None and state != _items_state:
+            bump_items_generation()
+        _items_state = state
+
+
+def items_deleted(item_ids: List[int]):
+    """เรียกหลัง commit การลบ item (ตรงๆ หรือผ่าน cascade จากการลบ user)"""
+    vector_index.remove_items(item_ids)
+    for item_id in item_ids:
+        boxed_image_cache.discard(item_id)
+    bump_items_generation()
+
+
+# ===========================
+# ภาพของ item ผ่าน URL
+# ===========================
+# list / search ส่งแค่ URL (ค่าเริ่มต้น) browser โหลดภาพย่อเองและ cache ได้
+# include_images=true ยังได้ base64 ของภาพเต็มแบบเดิม
+ITEM_IMAGE_VARIANTS = {
+    "thumbnail": "thumbnail_data",  # ภาพ crop ย่อ
+    "medium": "medium_data",  # ภาพต้นฉบับย่อ
+    "image": "image_data",  # ภาพ crop ขนาดจริง
+    "original": "original_image_data",  # ภาพต้นฉบับ
+}
+
+def item_image_urls(item) -> dict:
+    base = f"/api/items/{item.id}/image"
+    return {
+        "thumbnail_url": f"{base}/thumbnail",
+        "medium_url": f"{base}/medium",
+        "image_url": f"{base}/image",
+        "original_image_url": f"{base}/original",
+    }
+
+def with_images():
+    """options ของ query ที่ต้องใช้ bytes ภาพเต็ม (คอลัมน์ภาพเป็น deferred)"""
+    return [undefer(Item.image_data), undefer(Item.boxed_image_data), undefer(Item.original_image_data)]
+
+def get_item_image(db: Session, item_id: int, variant: str):
+    """คืน (bytes, media type) หรือ None ถ้าไม่มี item"""
+    item = db.get(Item, item_id)
+    if item is None:
+        return None
+    data = getattr(item, ITEM_IMAGE_VARIANTS[variant])
+    if data is None and variant in ("thumbnail", "medium"):
+        # item ที่ยังไม่ได้ backfill: สร้างภาพย่อตอนนี้แล้วเก็บไว้เลย
+        try:
+            item.thumbnail_data, item.medium_data = make_derivatives(item.image_data, item.original_image_data)
+            db.commit()
+            data = getattr(item, ITEM_IMAGE_VARIANTS[variant])
+        except Exception as e:
+            db.rollback()
+            print(f"[⚠️ Warning] Cannot create derivatives for item {item_id}: {e}")
+    if data is None:
+        data = item.image_data  # item ที่ไม่มีภาพต้นฉบับ
+    return data, sniff_media_type(data, item.image_content_type)
+
+# ===========================
+# ภาพพร้อมกรอบ detection (render ตอนขอ + cache)
+# ===========================
+# item ใหม่เก็บแค่กล่อง (Item.detections) ไม่เก็บภาพที่วาดกรอบแล้ว
+# cache อยู่ใน process: ลบ item ใน worker หนึ่ง worker อื่นไม่รู้ จึงปิดเป็นค่าเริ่มต้นเมื่อ WEB_CONCURRENCY > 1
+# (และ hit ทุกครั้งยังเช็คว่า item ยังอยู่ใน DB ก่อนคืนภาพ)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+BOXED_IMAGE_CACHE_SIZE = int(os.getenv("BOXED_IMAGE_CACHE_SIZE", "256" if WEB_CONCURRENCY <= 1 else "0"))
+boxed_image_cache = LRUCache(maxsize=BOXED_IMAGE_CACHE_SIZE)  # item_id -> (bytes, media type)
+
+def get_boxed_image(db: Session, item_id: int):
+    """คืน (bytes, media type) หรือ None ถ้าไม่มี item"""
+    cached = boxed_image_cache.get(item_id)
+    if cached is not None:
+        if db.query(Item.id).filter(Item.id == item_id).first() is not None:
+            return cached
+        boxed_image_cache.discard(item_id)
+        return None
+    item = db.get(Item, item_id)
+    if item is None:
+        return None
+    if item.boxed_image_data:
+        # item เก่า: ใช้ภาพที่เก็บไว้ (PNG หรือภาพต้นฉบับถ้าไม่เจอวัตถุ)
+        data = item.boxed_image_data
+        media_type = sniff_media_type(data, item.image_content_type)
+    elif item.detections:
+        data, media_type = render_boxed(item.image_data, item.detections), "image/jpeg"
+    else:
+        data, media_type = item.image_data, item.image_content_type
+    boxed_image_cache.put(item_id, (data, media_type))
+    return data, media_type
+
+
+def get_items(db: Session, type_filter: Optional[str] = None, include_images: bool = False) -> List[Item]:
     query = db.query(Item).options(joinedload(Item.user))
+    if include_images:
+        query = query.options(*with_images())
     if type_filter:
         query = query.filter(Item.type == type_filter)
     return query.all()
@@ -212,6 +360,11 @@ def encode_image(data, content_type):
     return None
 
 
+def boxed_image_url(item) -> str:
+    """ภาพพร้อมกรอบ detection ของ item (render ตอนขอ ดู routers/items.py)"""
+    return f"/api/items/{item.id}/boxed"
+
+
 def log_admin_action(db: Session, admin_id: int, admin_username: str, action: str, action_type: str = None):
     try:
         log = models.AdminLog(
@@ -230,6 +383,11 @@ def log_admin_action(db: Session, admin_id: int, admin_username: str, action: st
 # ===========================
 # ดึง user จาก session cookie
 # ===========================
+# origin ของ frontend ที่อนุญาตให้ส่ง cookie มา (CORS ใน main.py + ตรวจ Origin ของ WebSocket)
+ALLOWED_ORIGINS = [
+    "https://projectlostandfounds.netlify.app", "http://localhost:5173", "http://localhost:8000"
+]
+
 def get_current_user(session_token: Optional[str] = Cookie(None), db: Session = Depends(get_db)) -> User:
     if not session_token:
         raise HTTPException(status_code=401, detail="ต้อง login ก่อน")
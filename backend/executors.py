@@ -0,0 +1,87 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# ======================================================
+# Thread pool แยกสำหรับงาน CPU (YOLO / CLIP / PIL) และงาน I/O (DB / base64)
+# ======================================================
+# route แบบ async def ห้ามเรียกงาน blocking ตรงๆ เพราะจะหยุดทุก request ของ worker
+# ให้ await pool.run(fn, ...) แทน ทั้งสอง pool จำกัดจำนวนงานที่รอคิว
+# ถ้าเต็มจะ raise ExecutorSaturated (main.py แปลงเป็น 503) แทนการกองคิวไม่สิ้นสุด
+INFERENCE_POOL_WORKERS = int(os.getenv("INFERENCE_POOL_WORKERS", "2"))
+INFERENCE_POOL_QUEUE = int(os.getenv("INFERENCE_POOL_QUEUE", "32"))
+IO_POOL_WORKERS = int(os.getenv("IO_POOL_WORKERS", "8"))
+IO_POOL_QUEUE = int(os.getenv("IO_POOL_QUEUE", "128"))
+
+
+class ExecutorSaturated(Exception):
+    """คิวของ pool เต็ม"""
+
+    def __init__(self, name: str):
+        super().__init__(f"Executor '{name}' is saturated")
+        self.name = name
+
+
+class BoundedExecutor:
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.pending = 0  # รอคิว + กำลังรัน
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _task(self, fn, args, kwargs):
+        with self._lock:
+            self.active += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def _done(self, _future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(self.name)
+            self.pending += 1
+        future = self._executor.submit(self._task, fn, args, kwargs)
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "queue_depth": self.pending - self.active,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+
+inference_pool = BoundedExecutor("inference", INFERENCE_POOL_WORKERS, INFERENCE_POOL_QUEUE)
+io_pool = BoundedExecutor("io", IO_POOL_WORKERS, IO_POOL_QUEUE)
+
+
+def stats() -> dict:
+    return {"inference": inference_pool.stats(), "io": io_pool.stats()}
+
+
+def shutdown():
+    inference_pool.shutdown()
+    io_pool.shutdown()
@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+from PIL import Image
+
+from cache import LRUCache
+
+# ======================================================
+# cache ผล detect ของ frame กล้องที่แทบไม่เปลี่ยน (ต่อ user)
+# ======================================================
+# กล้องส่ง frame ติดกันที่เกือบเหมือนเดิม SHA-256 (image_cache) ไม่ช่วยเพราะ bytes ต่างกันทุก frame
+# จึงใช้ dHash 64 bit ของภาพย่อ ถ้า Hamming distance กับ frame ล่าสุดของ user คนเดิม
+# ไม่เกิน FRAME_CACHE_THRESHOLD จะคืนผลเดิมโดยไม่รัน YOLO / CLIP
+# ดู hit_distances ใน /metrics เพื่อปรับ threshold (distance สูงแต่ยังได้ผลถูก = เพิ่มได้)
+FRAME_CACHE_THRESHOLD = int(os.getenv("FRAME_CACHE_THRESHOLD", "6"))  # 0-64, -1 = ปิด
+FRAME_CACHE_PER_USER = int(os.getenv("FRAME_CACHE_PER_USER", "4"))
+FRAME_CACHE_TTL = float(os.getenv("FRAME_CACHE_TTL", "5"))  # วินาที
+FRAME_CACHE_MAX_USERS = int(os.getenv("FRAME_CACHE_MAX_USERS", "1024"))
+
+# user_id -> list ของ {"hash", "variant", "expires_at", "payload"} (ใหม่สุดอยู่หน้า)
+_recent = LRUCache(maxsize=FRAME_CACHE_MAX_USERS)
+_lock = threading.Lock()
+counters = {"hits": 0, "misses": 0}
+hit_distances = {}  # Hamming distance -> จำนวน hit
+
+
+def dhash(image: Image.Image) -> int:
+    """difference hash: ย่อเป็น 9x8 ขาวดำ แล้วเทียบพิกเซลติดกันในแถว"""
+    small = image.resize((9, 8), Image.BILINEAR, reducing_gap=2.0).convert("L")
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            bits = (bits << 1) | (left > pixels[row * 9 + col + 1])
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def lookup(user_id, frame_hash: int, variant=None):
+    """payload ของ frame ที่ใกล้ที่สุดภายใน threshold หรือ None
+    variant: option ของ request ที่ทำให้ผลต่างกัน ต้องตรงกันทุกตัว"""
+    if FRAME_CACHE_THRESHOLD < 0:
+        return None
+    now = time.monotonic()
+    best = None
+    with _lock:
+        entries = _recent.get(user_id) or []
+        for entry in entries:
+            if entry["expires_at"] < now or entry["variant"] != variant:
+                continue
+            distance = hamming(entry["hash"], frame_hash)
+            if distance <= FRAME_CACHE_THRESHOLD and (best is None or distance < best[0]):
+                best = (distance, entry)
+        if best is None:
+            counters["misses"] += 1
+            return None
+        counters["hits"] += 1
+        hit_distances[best[0]] = hit_distances.get(best[0], 0) + 1
+    return best[1]["payload"]
+
+
+def store(user_id, frame_hash: int, payload, variant=None):
+    """เก็บ payload (ห้ามแก้ไขหลังเก็บ ผู้เรียก copy เองก่อนส่งออก)"""
+    if FRAME_CACHE_THRESHOLD < 0 or FRAME_CACHE_PER_USER <= 0:
+        return
+    now = time.monotonic()
+    entry = {"hash": frame_hash, "variant": variant, "expires_at": now + FRAME_CACHE_TTL, "payload": payload}
+    with _lock:
+        entries = [e for e in (_recent.get(user_id) or []) if e["expires_at"] >= now]
+        _recent.put(user_id, [entry] + entries[:FRAME_CACHE_PER_USER - 1])
+
+
+def stats() -> dict:
+    with _lock:
+        total = counters["hits"] + counters["misses"]
+        return {
+            "users": len(_recent),
+            "threshold": FRAME_CACHE_THRESHOLD,
+            "ttl": FRAME_CACHE_TTL,
+            **counters,
+            "hit_rate": round(counters["hits"] / total, 4) if total else 0.0,
+            "hit_distances": dict(sorted(hit_distances.items())),
+        }
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import threading
+import numpy as np
+from sqlalchemy.orm import Session
+
+import models
+import model_registry
+import onnx_backend
+import utils
+from cache import LRUCache
+from executors import io_pool
+
+# ======================================================
+# cache ผล inference ต่อภาพ (key = SHA-256 ของ bytes)
+# ======================================================
+# รูปเดิมที่ถูกอัปโหลดซ้ำ / ใช้ค้นหาซ้ำ ไม่ต้องรัน CLIP / YOLO ใหม่
+# ชั้นแรกอยู่ในหน่วยความจำ (จำกัดจำนวน) ชั้นที่สองคือตาราง image_inference_cache
+# (เปิดด้วย IMAGE_CACHE_PERSIST=1 ใช้ร่วมกันได้ทุก worker และอยู่รอดหลัง restart)
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "1024"))
+IMAGE_CACHE_PERSIST = os.getenv("IMAGE_CACHE_PERSIST", "0") == "1"
+
+# เปลี่ยนโมเดล (รวมถึง CLIP_REVISION) / backend แล้วผลเก่าต้องไม่ถูกใช้
+MODEL_TAG = "|".join([
+    model_registry.EMBEDDING_MODEL_VERSION,
+    f"{model_registry.YOLO_REPO}/{model_registry.YOLO_FILENAME}",
+    model_registry.INFERENCE_BACKEND,
+    # ผล fp32 กับ int8 ต่างกันเล็กน้อย ห้ามใช้ cache ร่วมกัน
+    "int8" if model_registry.INFERENCE_BACKEND == "onnx" and onnx_backend.ONNX_QUANTIZED else "fp32",
+])
+
+# sha256 -> {"image_embedding": np.ndarray | None, "detections": list | None}
+image_cache = LRUCache(maxsize=IMAGE_CACHE_SIZE)
+# นับแยกตามชนิดผล (entry เดียวอาจมีแค่ embedding หรือแค่กล่อง)
+counters = {"embedding_hits": 0, "embedding_misses": 0, "detection_hits": 0, "detection_misses": 0}
+_counters_lock = threading.Lock()  # ถูกเรียกจากหลาย thread ของ inference_pool / io_pool
+
+
+def digest(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _count(kind: str, hit: bool):
+    with _counters_lock:
+        counters[f"{kind}_{'hits' if hit else 'misses'}"] += 1
+
+
+def _lookup(db: Session, key: str) -> dict:
+    entry = image_cache.get(key)
+    if entry is not None:
+        return entry
+    entry = {"image_embedding": None, "detections": None}
+    if IMAGE_CACHE_PERSIST and db is not None:
+        row = db.get(models.ImageInferenceCache, key)
+        if row is not None and row.model_tag == MODEL_TAG:
+            if row.image_embedding is not None:
+                emb = row.image_embedding
+                entry["image_embedding"] = np.asarray(emb.to_numpy() if hasattr(emb, "to_numpy") else emb, dtype=np.float32)
+            entry["detections"] = row.detections
+            image_cache.put(key, entry)
+    return entry
+
+
+def _store(db: Session, key: str, **fields):
+    entry = dict(_lookup(db, key))
+    entry.update(fields)
+    image_cache.put(key, entry)
+    if not IMAGE_CACHE_PERSIST or db is None:
+        return
+    emb = entry["image_embedding"]
+    try:
+        db.merge(models.ImageInferenceCache(
+            sha256=key,
+            model_tag=MODEL_TAG,
+            image_embedding=emb.tolist() if emb is not None else None,
+            detections=entry["detections"],
+        ))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[⚠️ Warning] Cannot save image cache: {e}")
+
+
+def get_embedding(db: Session, image_bytes: bytes, key: str = None):
+    """CLIP image embedding ที่เคยคำนวณไว้ หรือ None (key = digest ที่คำนวณไว้แล้ว ถ้ามี)"""
+    emb = _lookup(db, key or digest(image_bytes))["image_embedding"]
+    _count("embedding", emb is not None)
+    return emb.copy() if emb is not None else None
+
+
+def put_embedding(db: Session, image_bytes: bytes, embedding, key: str = None):
+    _store(db, key or digest(image_bytes), image_embedding=np.asarray(embedding, dtype=np.float32))
+
+
+def get_detections(db: Session, image_bytes: bytes, key: str = None):
+    """กล่อง YOLO ที่เคยตรวจจับไว้ (list, อาจว่าง) หรือ None ถ้ายังไม่เคยรัน"""
+    detections = _lookup(db, key or digest(image_bytes))["detections"]
+    _count("detection", detections is not None)
+    return [dict(d) for d in detections] if detections is not None else None
+
+
+def put_detections(db: Session, image_bytes: bytes, detections: list, key: str = None):
+    _store(db, key or digest(image_bytes), detections=[dict(d) for d in detections])
+
+
+# ============================
+# async (ใช้จาก route แบบ async def)
+# ============================
+# SHA-256 ของภาพทั้งไฟล์ และ db.get / db.merge + commit (IMAGE_CACHE_PERSIST=1) ห้ามทำบน event loop
+# จึงส่งไป io_pool ส่วน cache ในหน่วยความจำอย่างเดียวเร็วพอที่จะเรียกตรงๆ
+async def adigest(image_bytes: bytes) -> str:
+    return await io_pool.run(digest, image_bytes)
+
+
+async def _run(fn, *args):
+    if IMAGE_CACHE_PERSIST:
+        return await io_pool.run(fn, *args)
+    return fn(*args)
+
+
+async def aget_embedding(db: Session, key: str):
+    return await _run(get_embedding, db, None, key)
+
+
+async def aput_embedding(db: Session, key: str, embedding):
+    await _run(put_embedding, db, None, embedding, key)
+
+
+async def aget_detections(db: Session, key: str):
+    return await _run(get_detections, db, None, key)
+
+
+async def aput_detections(db: Session, key: str, detections: list):
+    await _run(put_detections, db, None, detections, key)
+
+
+async def aget_image_embedding(db: Session, image_bytes: bytes, image=None, key: str = None):
+    """เหมือน utils.aget_image_embedding แต่ข้าม CLIP ถ้าเคยเห็นภาพนี้แล้ว
+    image: PIL.Image ที่ decode ไว้แล้ว (ถ้ามี) จะไม่ decode bytes ซ้ำตอน miss"""
+    key = key or await adigest(image_bytes)
+    emb = await aget_embedding(db, key)
+    if emb is None:
+        emb = await utils.aget_image_embedding(image if image is not None else image_bytes)
+        await aput_embedding(db, key, emb)
+    return emb
+
+
+def stats() -> dict:
+    with _counters_lock:
+        snapshot = dict(counters)
+    return {"size": len(image_cache), "maxsize": image_cache.maxsize, "persist": IMAGE_CACHE_PERSIST, **snapshot}
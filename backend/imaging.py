@@ -0,0 +1,141 @@
+import io
+import os
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+# ======================================================
+# decode ภาพที่อัปโหลดเข้ามา (ใช้ร่วมกันทุก route / CLIP / YOLO)
+# ======================================================
+# รูปจากมือถือ 12+ ล้านพิกเซล แต่ YOLO ย่อเหลือ 640 และ CLIP เหลือ 224 อยู่ดี
+# JPEG ใช้ draft mode ให้ libjpeg decode ที่ 1/2, 1/4, 1/8 ของขนาดจริงได้เลย (DCT scaling)
+# เร็วกว่าและใช้หน่วยความจำน้อยกว่า decode เต็มแล้วค่อยย่อหลายเท่า
+INGEST_MAX_SIDE = int(os.getenv("INGEST_MAX_SIDE", "1280"))
+# ภาพที่ header บอกว่าใหญ่กว่านี้จะไม่ถูก decode เลย (กัน decompression bomb)
+INGEST_MAX_PIXELS = int(os.getenv("INGEST_MAX_PIXELS", str(50_000_000)))
+
+# ภาพย่อที่สร้างตอน ingest (ส่งให้หน้า list / search แทนภาพเต็มหลาย MB)
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "320"))  # ด้านยาวของ thumbnail (ภาพ crop)
+MEDIUM_SIZE = int(os.getenv("MEDIUM_SIZE", "1024"))  # ด้านยาวของ medium (ภาพต้นฉบับ)
+DERIVATIVE_FORMAT = os.getenv("DERIVATIVE_FORMAT", "WEBP").upper()  # WEBP หรือ JPEG
+DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", "80"))
+
+
+class ImageTooLarge(ValueError):
+    """จำนวนพิกเซลของภาพเกิน INGEST_MAX_PIXELS"""
+
+    def __init__(self, width: int, height: int):
+        super().__init__(f"Image is too large ({width}x{height}, max {INGEST_MAX_PIXELS} pixels)")
+        self.width = width
+        self.height = height
+
+
+def probe_image(image_bytes: bytes):
+    """อ่านแค่ header (ไม่ decode) คืน (width, height) ตรวจก่อนรับงานเข้าคิว"""
+    width, height = Image.open(io.BytesIO(image_bytes)).size
+    if width * height > INGEST_MAX_PIXELS:
+        raise ImageTooLarge(width, height)
+    return width, height
+
+
+def decode_image(source, max_side: int = INGEST_MAX_SIDE, draft_ratio: float = 0.5):
+    """decode bytes / file-like / path เป็น PIL RGB ด้านยาวไม่เกิน max_side
+    JPEG อาจเล็กกว่าได้ถึง max_side * draft_ratio (ค่าเริ่มต้นครึ่งหนึ่ง พอสำหรับ YOLO / CLIP)
+    ภาพที่ต้องได้ขนาดเต็ม max_side (thumbnail / medium) ให้ใช้ draft_ratio=1
+    หมุนภาพตาม EXIF orientation แล้ว
+    คืน (image, scale) โดย scale = ขนาดจริง / ขนาดที่ decode (ใช้แปลงพิกัดกลับ)"""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    image = Image.open(source)
+    width, height = image.size
+    if width * height > INGEST_MAX_PIXELS:
+        raise ImageTooLarge(width, height)
+
+    long_side = max(width, height)
+    if max_side and long_side > max_side:
+        ratio = max_side / long_side * draft_ratio
+        # draft เลือกตัวหาร (2/4/8) ที่ยังได้ภาพไม่เล็กกว่าขนาดที่ขอ ค่าเริ่มต้นขอครึ่งหนึ่งของ max_side
+        # ด้านยาวจึงออกมาระหว่าง max_side/2 ถึง max_side โดยไม่ต้อง resize ซ้ำ (ไม่ใช่ JPEG จะไม่ทำอะไร)
+        image.draft("RGB", (max(1, int(width * ratio)), max(1, int(height * ratio))))
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.BICUBIC)
+    return image, long_side / max(image.size)
+
+
+def open_image(source, max_side: int = INGEST_MAX_SIDE, draft_ratio: float = 0.5) -> Image.Image:
+    """เหมือน decode_image แต่คืนแค่ภาพ"""
+    return decode_image(source, max_side, draft_ratio)[0]
+
+
+def scale_detections(detections: list, scale: float) -> list:
+    """คูณพิกัดกล่องด้วย scale (คืน list ใหม่ ไม่แก้ของเดิม)"""
+    if scale == 1:
+        return [dict(d) for d in detections]
+    return [
+        {**d, **{k: round(d[k] * scale, 2) for k in ("x1", "y1", "x2", "y2")}}
+        for d in detections
+    ]
+
+
+def draw_detections(image: Image.Image, detections: list, padding: int = 5) -> Image.Image:
+    """วาดกรอบแดง + label/confidence ลงบนสำเนาของภาพ (พิกัดกล่องอยู่ในระบบพิกัดของ image)"""
+    image = image.convert("RGB")
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.truetype("arial.ttf", size=16)
+    except OSError:
+        font = ImageFont.load_default()
+    for d in detections:
+        x1 = max(int(d["x1"]) - padding, 0)
+        y1 = max(int(d["y1"]) - padding, 0)
+        x2 = min(int(d["x2"]) + padding, image.width - 1)
+        y2 = min(int(d["y2"]) + padding, image.height - 1)
+        draw.rectangle([x1, y1, x2, y2], outline="red", width=3)
+        draw.text((x1, max(y1 - 16, 0)), f"{d['label']} {d['confidence']:.2f}", fill="white", font=font)
+    return image
+
+
+def render_boxed(image_bytes: bytes, detections: list, quality: int = 90) -> bytes:
+    """ภาพพร้อมกรอบ detection เป็น JPEG (ใช้ตอน client ขอดู ไม่ได้เก็บลง DB)"""
+    image = draw_detections(Image.open(io.BytesIO(image_bytes)), detections)
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+
+# ===========================
+# thumbnail / medium
+# ===========================
+def encode_derivative(image: Image.Image, max_side: int) -> bytes:
+    """ย่อสำเนาของภาพให้ด้านยาวไม่เกิน max_side แล้ว encode เป็น DERIVATIVE_FORMAT"""
+    image = image.convert("RGB") if image.mode != "RGB" else image.copy()
+    image.thumbnail((max_side, max_side), Image.BICUBIC)
+    out = io.BytesIO()
+    if DERIVATIVE_FORMAT == "WEBP":
+        image.save(out, format="WEBP", quality=DERIVATIVE_QUALITY, method=4)
+    else:
+        image.save(out, format="JPEG", quality=DERIVATIVE_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def make_derivatives(image_bytes: bytes, original_bytes: bytes = None):
+    """คืน (thumbnail ของภาพ crop, medium ของภาพต้นฉบับ) ใช้กับ item ที่ยังไม่มี (backfill)"""
+    thumbnail = encode_derivative(open_image(image_bytes, THUMBNAIL_SIZE, draft_ratio=1), THUMBNAIL_SIZE)
+    return thumbnail, make_medium(original_bytes or image_bytes)
+
+
+def make_medium(image_bytes: bytes) -> bytes:
+    """medium ของภาพต้นฉบับ decode ใหม่ด้วย draft เท่าขนาดจริง (ภาพ ingest อาจเล็กกว่า MEDIUM_SIZE)"""
+    return encode_derivative(open_image(image_bytes, MEDIUM_SIZE, draft_ratio=1), MEDIUM_SIZE)
+
+
+def sniff_media_type(data: bytes, default: str = "application/octet-stream") -> str:
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    return default
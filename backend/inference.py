@@ -0,0 +1,111 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from executors import inference_pool
+
+# ======================================================
+# Micro-batching สำหรับ inference
+# ======================================================
+# รวม request ที่เข้ามาใกล้ๆ กันเป็น batch เดียว (สูงสุด max_batch รายการ
+# หรือรอไม่เกิน max_wait_ms) แล้วเรียก batch_fn ครั้งเดียว
+# ผลลัพธ์ส่งกลับผ่าน concurrent.futures.Future ใช้ได้ทั้งโค้ด sync (.result())
+# และ async (await scheduler.asubmit)
+INFERENCE_BATCHING = os.getenv("INFERENCE_BATCHING", "1") == "1"
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "16"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+
+
+class BatchScheduler:
+    def __init__(self, name: str, batch_fn, max_batch: int = INFERENCE_MAX_BATCH,
+                 max_wait_ms: float = INFERENCE_MAX_WAIT_MS, enabled: bool = INFERENCE_BATCHING):
+        self.name = name
+        self.batch_fn = batch_fn  # รับ list ของ input คืน list ของผลลัพธ์ลำดับเดียวกัน
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.enabled = enabled
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.split_batches = 0  # batch ที่ล้มแล้วต้องรันแยกทีละรายการ
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"batch-{self.name}", daemon=True)
+                self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        if not self.enabled:
+            self._execute([(item, future)])
+            return future
+        self._ensure_started()
+        self._queue.put((item, future))
+        return future
+
+    async def asubmit(self, item):
+        """สำหรับ route แบบ async: await ผลโดยไม่ block event loop
+        ถ้าปิด batching (INFERENCE_BATCHING=0) submit จะรันใน thread ของผู้เรียก จึงส่งไป inference_pool แทน"""
+        if not self.enabled:
+            return (await inference_pool.run(self.batch_fn, [item]))[0]
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _execute(self, batch):
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # input เสียตัวเดียวไม่ควรทำให้ทั้ง batch ล้ม: รันแยกทีละรายการ ให้ error ตกแค่ตัวที่เสีย
+            self.split_batches += 1
+            for item, future in batch:
+                try:
+                    future.set_result(self.batch_fn([item])[0])
+                except Exception as item_error:
+                    future.set_exception(item_error)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _run(self):
+        while True:
+            self._execute(self._collect())
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queue_depth": self._queue.qsize(),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "split_batches": self.split_batches,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
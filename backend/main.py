@@ -1,10 +1,22 @@
-from fastapi import FastAPI
+import os
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from database import Base, engine
-from routers import detect, auth, items, search, chats, admin,report
+from fastapi.responses import JSONResponse
+from database import Base, engine, SessionLocal
+from crud import ALLOWED_ORIGINS
+from routers import detect, auth, items, search, chats, admin,report, health
+import migrations
+import model_registry
+import executors
+import imaging
+import vector_index
+import translation
+import upload_worker
 
 # สร้างตารางถ้ายังไม่มี
+migrations.create_extensions(engine)
 Base.metadata.create_all(bind=engine)
+migrations.run_migrations(engine)
 
 app = FastAPI(title="Lost & Found API")
 
@@ -13,17 +25,70 @@ app = FastAPI(title="Lost & Found API")
 # ========================
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "https://projectlostandfounds.netlify.app","http://localhost:5173","http://localhost:8000"  # frontend domain
-    ],
+    allow_origins=ALLOWED_ORIGINS,  # frontend domain (ดู crud.ALLOWED_ORIGINS)
     allow_credentials=True,      # สำคัญสำหรับ cookie
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# ========================
+# โหลด embedding index เข้าหน่วยความจำ (SEARCH_ENGINE=memory)
+# ========================
+@app.on_event("startup")
+def load_embedding_index():
+    if not vector_index.ENABLED:
+        return
+    db = SessionLocal()
+    try:
+        vector_index.load_from_db(db)
+    finally:
+        db.close()
+
+# ========================
+# โหลด + warm-up โมเดลใน background (MODEL_PRELOAD=0 -> โหลดตอนใช้งานครั้งแรก)
+# ระหว่างนี้ /readyz ตอบ 503 และ route ที่ใช้โมเดลตอบ 503 แทนการค้าง
+# ========================
+@app.on_event("startup")
+def preload_models():
+    if os.getenv("MODEL_PRELOAD", "1") == "1":
+        model_registry.start_background_loading()
+
+# ========================
+# worker ของคิว upload (UPLOAD_WORKER_ENABLED=0 ถ้ารันแยกด้วย python -m upload_worker)
+# ========================
+@app.on_event("startup")
+def start_upload_worker():
+    if upload_worker.UPLOAD_WORKER_ENABLED:
+        upload_worker.start()
+
+@app.exception_handler(model_registry.ModelNotReady)
+async def model_not_ready_handler(request: Request, exc: model_registry.ModelNotReady):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "model": exc.name, "state": exc.state},
+        headers={"Retry-After": "5"},
+    )
+
+# pool เต็ม: ตอบ 503 ให้ client ลองใหม่ แทนการกองคิวไม่สิ้นสุด
+@app.exception_handler(executors.ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: executors.ExecutorSaturated):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+# ภาพใหญ่เกิน INGEST_MAX_PIXELS (ดู imaging.py)
+@app.exception_handler(imaging.ImageTooLarge)
+async def image_too_large_handler(request: Request, exc: imaging.ImageTooLarge):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await translation.close_client()
+    upload_worker.stop()
+    executors.shutdown()
+
 # ========================
 # รวม routers
 # ========================
+app.include_router(health.router)
 app.include_router(detect.router)
 app.include_router(auth.router)
 app.include_router(items.router)
@@ -0,0 +1,125 @@
+import os
+from datetime import datetime
+from sqlalchemy import Float, func, literal, select, union, text as sql_text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, joinedload
+
+import crud
+import models
+import vector_index
+from models import embedding_distance, embedding_similarity
+
+# ======================================================
+# จับคู่ lost <-> found อัตโนมัติหลังสร้าง item
+# ======================================================
+MATCH_TOP_K = int(os.getenv("MATCH_TOP_K", "10"))
+MATCH_TEXT_WEIGHT = float(os.getenv("MATCH_TEXT_WEIGHT", "0.4"))
+MATCH_IMAGE_WEIGHT = float(os.getenv("MATCH_IMAGE_WEIGHT", "0.6"))
+MATCH_CANDIDATES = int(os.getenv("MATCH_CANDIDATES", "50"))
+
+
+def opposite_type(item_type: str) -> str:
+    return "found" if item_type == "lost" else "lost"
+
+
+def _candidate_ids(db: Session, item: models.Item, limit: int):
+    """nearest neighbour ฝั่งตรงข้ามจากทั้ง text และ image embedding"""
+    target = opposite_type(item.type)
+    embeddings = [
+        (kind, emb)
+        for kind, emb in (("text", item.text_embedding), ("image", item.image_embedding))
+        if emb is not None
+    ]
+    if not embeddings:
+        return None
+
+    if vector_index.ENABLED:
+        return list({
+            item_id
+            for kind, emb in embeddings
+            for item_id, _ in vector_index.get_index(kind).search(emb, limit, type=target)
+        })
+
+    Item = models.Item
+    db.execute(sql_text(f"SET LOCAL hnsw.ef_search = {min(max(limit, 40), 1000)}"))
+    candidate_sets = []
+    for kind, emb in embeddings:
+        column = Item.text_embedding if kind == "text" else Item.image_embedding
+        candidate_sets.append(
+            select(Item.id)
+            .where(Item.type == target, column.isnot(None))
+            .order_by(embedding_distance(column, emb))
+            .limit(limit)
+        )
+    return select(union(*[select(q.subquery().c.id) for q in candidate_sets]).subquery().c.id)
+
+
+def compute_matches(db: Session, item: models.Item, k: int = MATCH_TOP_K):
+    """คืน list ของ (matched_item_id, score, text_score, image_score) เรียงจากมากไปน้อย"""
+    candidates = _candidate_ids(db, item, max(k * 4, MATCH_CANDIDATES))
+    if candidates is None:
+        return []
+
+    Item = models.Item
+    text_score = (
+        func.coalesce(embedding_similarity(Item.text_embedding, item.text_embedding), 0.0)
+        if item.text_embedding is not None else literal(0.0, Float)
+    )
+    image_score = (
+        func.coalesce(embedding_similarity(Item.image_embedding, item.image_embedding), 0.0)
+        if item.image_embedding is not None else literal(0.0, Float)
+    )
+    total_weight = (MATCH_TEXT_WEIGHT + MATCH_IMAGE_WEIGHT) or 1.0
+    score = ((MATCH_TEXT_WEIGHT * text_score + MATCH_IMAGE_WEIGHT * image_score) / total_weight).label("score")
+
+    rows = (
+        db.query(Item.id, score, text_score.label("text_score"), image_score.label("image_score"))
+        .filter(Item.id.in_(candidates), Item.user_id != item.user_id)
+        .order_by(score.desc())
+        .limit(k)
+        .all()
+    )
+    return [(row.id, float(row.score), float(row.text_score), float(row.image_score)) for row in rows]
+
+
+def refresh_matches(db: Session, item: models.Item, k: int = MATCH_TOP_K) -> int:
+    """คำนวณ match ของ item แล้วบันทึกลง item_matches ทั้งสองทิศทาง
+    (item ที่เจอจะเห็น item ใหม่ใน match ของตัวเองด้วย)"""
+    matches = compute_matches(db, item, k)
+    db.query(models.ItemMatch).filter(models.ItemMatch.item_id == item.id).delete()
+    if matches:
+        now = datetime.utcnow()
+        rows = []
+        for matched_id, score, text_score, image_score in matches:
+            common = {"score": score, "text_score": text_score, "image_score": image_score, "created_at": now}
+            rows.append({"item_id": item.id, "matched_item_id": matched_id, **common})
+            rows.append({"item_id": matched_id, "matched_item_id": item.id, **common})
+        stmt = insert(models.ItemMatch).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_item_matches_pair",
+            set_={
+                "score": stmt.excluded.score,
+                "text_score": stmt.excluded.text_score,
+                "image_score": stmt.excluded.image_score,
+                "created_at": stmt.excluded.created_at,
+            },
+        )
+        db.execute(stmt)
+    db.commit()
+    return len(matches)
+
+
+def get_matches(db: Session, item_id: int, limit: int = MATCH_TOP_K, include_images: bool = False):
+    """include_images=True โหลดคอลัมน์ภาพเต็มของ matched_item มาใน query เดียวกัน"""
+    matched = joinedload(models.ItemMatch.matched_item)
+    return (
+        db.query(models.ItemMatch)
+        .options(
+            matched.joinedload(models.Item.user),
+            matched.options(*crud.with_images()) if include_images else matched,
+        )
+        .filter(models.ItemMatch.item_id == item_id)
+        .order_by(models.ItemMatch.score.desc())
+        .limit(limit)
+        .all()
+    )
@@ -0,0 +1,144 @@
+import argparse
+import numpy as np
+from sqlalchemy import bindparam, select, text
+from database import Base
+import models
+from models import EMBEDDING_DIM, EMBEDDING_OPS, EMBEDDING_STORAGE, SEARCH_TEXT_SQL
+
+# ======================================================
+# Migration แบบ idempotent (รันซ้ำได้ทุกครั้งที่ start)
+# ======================================================
+# extension ที่ต้องมีก่อน create_all (คอลัมน์ Vector ต้องใช้ pgvector)
+EXTENSIONS = [
+    "CREATE EXTENSION IF NOT EXISTS vector",
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+]
+
+# คำสั่งปรับ schema ของตารางที่มีอยู่แล้ว (create_all ไม่แก้ตารางเดิม)
+STATEMENTS = [
+    f"ALTER TABLE items ADD COLUMN IF NOT EXISTS search_text TEXT GENERATED ALWAYS AS ({SEARCH_TEXT_SQL}) STORED",
+    "ALTER TABLE items ADD COLUMN IF NOT EXISTS embedding_model_version VARCHAR",
+    "ALTER TABLE items ADD COLUMN IF NOT EXISTS detections JSON",
+    "ALTER TABLE items ADD COLUMN IF NOT EXISTS thumbnail_data BYTEA",
+    "ALTER TABLE items ADD COLUMN IF NOT EXISTS medium_data BYTEA",
+]
+
+
+def create_extensions(engine):
+    with engine.begin() as conn:
+        for stmt in EXTENSIONS:
+            conn.execute(text(stmt))
+
+
+# คอลัมน์ embedding -> ชื่อ HNSW index
+EMBEDDING_INDEXES = {
+    "text_embedding": "ix_items_text_embedding_hnsw",
+    "image_embedding": "ix_items_image_embedding_hnsw",
+}
+
+
+def _embedding_schema(conn):
+    """คืน (type ของแต่ละคอลัมน์ เช่น vector(512), indexdef ของแต่ละ HNSW index)"""
+    types = dict(conn.execute(text(
+        "SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute "
+        "WHERE attrelid = 'items'::regclass AND attname IN ('text_embedding', 'image_embedding')"
+    )).all())
+    indexes = dict(conn.execute(text(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'items'"
+    )).all())
+    return types, indexes
+
+
+def normalize_embeddings(engine, batch_size: int = 500):
+    """L2-normalise embedding ที่มีอยู่ทุกแถว (idempotent, ทีละ batch ตาม id)"""
+    table = models.Item.__table__
+    update = (
+        table.update()
+        .where(table.c.id == bindparam("_id"))
+        .values(text_embedding=bindparam("_text"), image_embedding=bindparam("_image"))
+    )
+    last_id, total = 0, 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.text_embedding, table.c.image_embedding)
+                .where(table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            params = [
+                {"_id": item_id, "_text": _unit(text_emb), "_image": _unit(image_emb)}
+                for item_id, text_emb, image_emb in rows
+            ]
+            conn.execute(update, params)
+        last_id = rows[-1][0]
+        total += len(rows)
+    print(f"✅ Normalised embeddings of {total} items")
+
+
+def _unit(vec):
+    if vec is None:
+        return None
+    if hasattr(vec, "to_numpy"):  # HalfVector
+        vec = vec.to_numpy()
+    vec = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return (vec / norm if norm > 0 else vec).tolist()
+
+
+def migrate_embeddings(engine):
+    """ย้าย embedding เดิม (vector + cosine index) ไปเป็น unit vector + inner-product index
+    และเปลี่ยน type ตาม EMBEDDING_STORAGE (vector <-> halfvec) ถ้ายังไม่ตรง"""
+    target_type = f"{EMBEDDING_STORAGE}({EMBEDDING_DIM})"
+    with engine.begin() as conn:
+        types, indexes = _embedding_schema(conn)
+    if not types:
+        return
+    stale_indexes = [name for name in EMBEDDING_INDEXES.values()
+                     if name in indexes and EMBEDDING_OPS not in indexes[name]]
+    retype = [column for column, type_ in types.items() if type_ != target_type]
+    if not stale_indexes and not retype:
+        return
+
+    print(f"🔧 Migrating embeddings to {target_type} / {EMBEDDING_OPS} ...")
+    # index เดิมผูกกับ opclass/type เก่า ต้องลบก่อน แล้ว run_migrations จะสร้างใหม่
+    with engine.begin() as conn:
+        for name in EMBEDDING_INDEXES.values():
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        for column in retype:
+            conn.execute(text(
+                f"ALTER TABLE items ALTER COLUMN {column} TYPE {target_type} USING {column}::{target_type}"
+            ))
+    normalize_embeddings(engine)
+
+
+def run_migrations(engine):
+    """เพิ่มคอลัมน์/ index ใหม่ให้ตารางที่ถูกสร้างไว้ก่อนหน้า"""
+    with engine.begin() as conn:
+        for stmt in STATEMENTS:
+            conn.execute(text(stmt))
+
+    migrate_embeddings(engine)
+
+    # index ที่ประกาศใน models (เช่น HNSW) จะถูกสร้างเฉพาะตอนสร้างตารางใหม่
+    # จึงต้องไล่สร้างเองสำหรับตารางเดิม
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+if __name__ == "__main__":
+    # python -m migrations [--normalize] : รัน migration ทั้งหมดโดยไม่ต้อง start server
+    parser = argparse.ArgumentParser(description="Run schema migrations")
+    parser.add_argument("--normalize", action="store_true", help="re-normalise every stored embedding")
+    args = parser.parse_args()
+
+    from database import engine
+
+    create_extensions(engine)
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    if args.normalize:
+        normalize_embeddings(engine)
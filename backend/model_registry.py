@@ -0,0 +1,253 @@
+import os
+import threading
+import time
+import numpy as np
+import torch
+
+# ======================================================
+# Model registry: ทุกโมเดลถูกโหลดครั้งเดียวต่อ process แล้วแชร์ให้ทุก module
+# ======================================================
+HF_TOKEN = os.getenv("HF_TOKEN")  # สำหรับ private repo
+CLIP_REPO = os.getenv("CLIP_REPO", "freemanlnwza/modelCLIPfine-tuned")
+CLIP_REVISION = os.getenv("CLIP_REVISION")  # branch / tag / commit ของ repo (None = main)
+# บันทึกลง items.embedding_model_version เปลี่ยนค่านี้เมื่ออัปเดตโมเดลแล้วรัน python -m reembed
+EMBEDDING_MODEL_VERSION = os.getenv(
+    "EMBEDDING_MODEL_VERSION", f"{CLIP_REPO}@{CLIP_REVISION}" if CLIP_REVISION else CLIP_REPO
+)
+YOLO_REPO = os.getenv("YOLO_REPO", "freemanlnwza/modelYOLOv8")
+YOLO_FILENAME = os.getenv("YOLO_FILENAME", "weights/best.pt")
+# เวลารอก่อนลองโหลดใหม่เมื่อโหลดไม่สำเร็จ (เช่น hub ล่ม)
+MODEL_LOAD_RETRY_SECONDS = float(os.getenv("MODEL_LOAD_RETRY_SECONDS", "30"))
+# torch (float32 เดิม) หรือ onnx (ONNX Runtime บน CPU ดู onnx_backend.py)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+
+device = "cuda" if torch.cuda.is_available() else "cpu"  # ตรวจสอบ device
+
+
+class ModelNotReady(Exception):
+    """โมเดลยังโหลด/warm-up ไม่เสร็จ หรือโหลดไม่สำเร็จ (main.py แปลงเป็น 503)"""
+
+    def __init__(self, name: str, state: str):
+        super().__init__(f"Model '{name}' is not ready ({state})")
+        self.name = name
+        self.state = state
+
+
+class ModelHandle:
+    """handle ของโมเดลที่แชร์กันทั้ง process
+    - load() โหลด + warm-up (thread-safe) ครั้งต่อไปคืน instance เดิม
+    - get() คืนโมเดลที่พร้อมแล้ว ถ้ากำลังโหลดอยู่เบื้องหลังจะ raise ModelNotReady
+      แทนการรอ (ถ้ายังไม่มีใครสั่งโหลด เช่นในสคริปต์ CLI จะโหลดให้ทันที
+      และถ้าโหลดไม่สำเร็จโดยไม่มี background loader จะลองใหม่เมื่อครบ MODEL_LOAD_RETRY_SECONDS)
+    - lock ใช้ครอบการเรียกโมเดลที่ไม่ thread-safe (เช่น YOLO predictor)"""
+
+    def __init__(self, name: str, loader, warmup=None):
+        self.name = name
+        self._loader = loader
+        self._warmup = warmup
+        self._value = None
+        self._load_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.state = "not_loaded"  # not_loaded / loading / warming / ready / failed
+        self.error = None
+        self.load_seconds = None
+        self.failed_at = None
+        self.background = False  # มี thread ของ _load_in_background คอยลองใหม่ให้อยู่แล้ว
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def load(self):
+        with self._load_lock:
+            if self._value is not None:
+                return self._value
+            start = time.monotonic()
+            self.state = "loading"
+            try:
+                value = self._loader()
+                if self._warmup is not None:
+                    self.state = "warming"
+                    self._warmup(value)
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                self.failed_at = time.monotonic()
+                print(f"❌ Failed to load {self.name}: {e}")
+                raise
+            self._value = value
+            self.load_seconds = round(time.monotonic() - start, 2)
+            self.state = "ready"
+            self.error = None
+            return value
+
+    def get(self):
+        if self._value is not None:
+            return self._value
+        if self.state == "not_loaded":
+            return self.load()
+        if (self.state == "failed" and not self.background
+                and time.monotonic() - self.failed_at >= MODEL_LOAD_RETRY_SECONDS):
+            return self.load()
+        raise ModelNotReady(self.name, self.state)
+
+    def status(self) -> dict:
+        return {"state": self.state, "error": self.error, "load_seconds": self.load_seconds}
+
+
+def load_torch_clip():
+    from transformers import CLIPProcessor, CLIPModel
+
+    print("✅ Loading fine-tuned CLIP from Hugging Face...")
+    processor = CLIPProcessor.from_pretrained(
+        CLIP_REPO,
+        revision=CLIP_REVISION,
+        token=HF_TOKEN  # v5 Transformers ใช้ token แทน use_auth_token
+    )
+    model = CLIPModel.from_pretrained(
+        CLIP_REPO,
+        revision=CLIP_REVISION,
+        token=HF_TOKEN
+    ).to(device)
+    model.eval()
+    print("✅ Fine-tuned CLIP loaded from HF.")
+    return model, processor
+
+
+def load_torch_yolo():
+    from huggingface_hub import hf_hub_download
+    from ultralytics import YOLO
+
+    print("🚀 Downloading YOLOv8 weights from Hugging Face (private repo)...")
+    model_path = hf_hub_download(
+        repo_id=YOLO_REPO,
+        filename=YOLO_FILENAME,
+        token=HF_TOKEN
+    )
+    model = YOLO(model_path)
+    print("✅ YOLOv8 model loaded successfully.")
+    return model
+
+
+def _load_clip():
+    if INFERENCE_BACKEND != "onnx":
+        return load_torch_clip()
+    from transformers import CLIPProcessor
+    import onnx_backend
+
+    # processor (tokenizer + image preprocessing) ยังมาจาก repo เดิม
+    processor = CLIPProcessor.from_pretrained(CLIP_REPO, revision=CLIP_REVISION, token=HF_TOKEN)
+    model = onnx_backend.OnnxClip()
+    print(f"✅ CLIP loaded from ONNX (quantized={onnx_backend.ONNX_QUANTIZED}).")
+    return model, processor
+
+
+def _load_yolo():
+    if INFERENCE_BACKEND != "onnx":
+        return load_torch_yolo()
+    from ultralytics import YOLO
+    import onnx_backend
+
+    # ultralytics รัน .onnx ผ่าน ONNX Runtime เองด้วย predict() API เดิม
+    model = YOLO(onnx_backend.onnx_path("yolo"), task="detect")
+    print(f"✅ YOLOv8 loaded from ONNX (quantized={onnx_backend.ONNX_QUANTIZED}).")
+    return model
+
+
+# ======================================================
+# helper ให้ utils เรียก CLIP ได้เหมือนกันทั้งสอง backend
+# ======================================================
+def clip_inputs(processor, **kwargs) -> dict:
+    """เรียก processor แล้วคืน input ในรูปที่ backend ปัจจุบันรับ
+    (torch tensor บน device หรือ numpy array สำหรับ onnx)
+    ข้อความยาวเกิน 77 token ถูกตัดทิ้ง (ไม่อย่างนั้น text tower จะ error)"""
+    if "text" in kwargs:
+        kwargs.setdefault("truncation", True)
+    if INFERENCE_BACKEND == "onnx":
+        return dict(processor(return_tensors="np", **kwargs))
+    inputs = processor(return_tensors="pt", **kwargs)
+    return {k: v.to(device) for k, v in inputs.items()}
+
+
+def to_numpy(features) -> np.ndarray:
+    if isinstance(features, np.ndarray):
+        return features
+    return features.cpu().numpy()
+
+
+# ======================================================
+# warm-up: dummy forward pass ให้ lazy init / kernel selection เกิดก่อนรับ traffic
+# ======================================================
+def _warmup_clip(value):
+    from PIL import Image
+
+    model, processor = value
+    inputs = clip_inputs(processor, text=["warm up"], images=Image.new("RGB", (224, 224)), padding=True)
+    with torch.no_grad():
+        model.get_text_features(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"])
+        model.get_image_features(pixel_values=inputs["pixel_values"])
+
+
+def _warmup_yolo(model):
+    from PIL import Image
+
+    model.predict(Image.new("RGB", (640, 640)), verbose=False)
+
+
+clip = ModelHandle("clip", _load_clip, _warmup_clip)
+yolo = ModelHandle("yolo", _load_yolo, _warmup_yolo)
+
+MODELS = {"clip": clip, "yolo": yolo}
+
+
+def yolo_predict(image, **kwargs):
+    """เรียก YOLO predict แบบ thread-safe (predictor ของ ultralytics เก็บ state ภายใน)"""
+    model = yolo.get()
+    with yolo.lock:
+        return model.predict(image, verbose=False, **kwargs)
+
+
+def yolo_detect(image) -> list:
+    """YOLO predict แล้วแปลงเป็น list ของ dict {x1, y1, x2, y2, confidence, label}
+    (รูปแบบเดียวกับที่ /detect/frame ส่งกลับ และที่เก็บใน image_cache)"""
+    results = yolo_predict(image)
+    detections = []
+    if results and len(results[0].boxes) > 0:
+        names = results[0].names
+        for box in results[0].boxes:
+            x1, y1, x2, y2 = box.xyxy[0].tolist()
+            detections.append({
+                "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+                "confidence": float(box.conf[0]),
+                "label": names[int(box.cls[0])],
+            })
+    return detections
+
+
+def status() -> dict:
+    return {name: handle.status() for name, handle in MODELS.items()}
+
+
+def all_ready() -> bool:
+    return all(handle.ready for handle in MODELS.values())
+
+
+def _load_in_background(handle: ModelHandle):
+    # ลองใหม่เรื่อยๆ จนสำเร็จ ระหว่างนี้ route อื่น (auth / chat / list) ยังใช้งานได้ปกติ
+    while True:
+        try:
+            handle.load()
+            return
+        except Exception:
+            time.sleep(MODEL_LOAD_RETRY_SECONDS)
+
+
+def start_background_loading():
+    """เริ่มโหลด + warm-up ทุกโมเดลใน background thread (เรียกตอน startup)"""
+    for handle in MODELS.values():
+        if handle.state in ("not_loaded", "failed") and not handle.background:
+            handle.state = "loading"
+            handle.background = True
+            threading.Thread(
+                target=_load_in_background, args=(handle,), name=f"load-{handle.name}", daemon=True
+            ).start()
@@ -1,8 +1,9 @@
 from database import Base
-from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey, DateTime, func, Text, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey, DateTime, func, Text, Boolean, Index, Computed, Float, UniqueConstraint, JSON
+from sqlalchemy.orm import deferred, relationship
 from datetime import datetime
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import HALFVEC, Vector
+import os
 
 class Session(Base):
     __tablename__ = "sessions"
@@ -59,6 +60,27 @@ class EmailOTP(Base):
 # ======================
 # Item Model
 # ======================
+# ต้องตรงกับ normalize_text ใน routers/search.py
+SEARCH_TEXT_SQL = "regexp_replace(lower(title || ' ' || type || ' ' || category), '[[:punct:]]', '', 'g')"
+
+# embedding ถูก L2-normalise ก่อนบันทึก (crud.create_item) -> cosine = inner product
+# EMBEDDING_STORAGE=halfvec เก็บเป็น float16 (pgvector >= 0.7) ลดขนาดตาราง/index ครึ่งหนึ่ง
+EMBEDDING_DIM = 512
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "vector").lower()
+EmbeddingType = HALFVEC if EMBEDDING_STORAGE == "halfvec" else Vector
+EMBEDDING_OPS = "halfvec_ip_ops" if EMBEDDING_STORAGE == "halfvec" else "vector_ip_ops"
+
+
+def embedding_distance(column, query):
+    """ใช้ใน ORDER BY (ตรงกับ opclass ของ HNSW index) ค่าน้อย = ใกล้"""
+    return column.max_inner_product(query)
+
+
+def embedding_similarity(column, query):
+    """inner product ของ vector ที่ normalise แล้ว = cosine similarity"""
+    return column.max_inner_product(query) * -1
+
+
 class Item(Base):
     __tablename__ = "items"
 
@@ -67,19 +89,132 @@ class Item(Base):
     type = Column(String, nullable=False)  # lost หรือ found
     category = Column(String, nullable=False)  # หมวดหมู่
 
-    image_data = Column(LargeBinary, nullable=False)  # ไฟล์รูปไบต์ของไอเท็ม
+    # คอลัมน์ภาพเป็น deferred: query รายการไม่ต้องดึง bytes ทุกแถว (โหลดเมื่อเข้าถึง attribute)
+    image_data = deferred(Column(LargeBinary, nullable=False))  # ไฟล์รูปไบต์ของไอเท็ม
     image_filename = Column(String, nullable=False)  # ชื่อไฟล์
     image_content_type = Column(String, nullable=False)  # ประเภทไฟล์ (MIME)
-    boxed_image_data = Column(LargeBinary, nullable=True)  # รูปพร้อมกรอบ (optional)
+    boxed_image_data = deferred(Column(LargeBinary, nullable=True))  # รูปพร้อมกรอบ (item เก่า, item ใหม่ใช้ detections)
+    detections = Column(JSON, nullable=True)  # กล่อง YOLO เทียบกับ image_data [{x1, y1, x2, y2, label, confidence}]
+    thumbnail_data = deferred(Column(LargeBinary, nullable=True))  # image_data ย่อ (WebP, imaging.THUMBNAIL_SIZE)
+    medium_data = deferred(Column(LargeBinary, nullable=True))  # original_image_data ย่อ (WebP, imaging.MEDIUM_SIZE)
 
-    text_embedding = Column(Vector(512), nullable=True)  # embedding ของข้อความ
-    image_embedding = Column(Vector(512), nullable=True)  # embedding ของภาพ
-    original_image_data = Column(LargeBinary, nullable=True)
+    text_embedding = Column(EmbeddingType(EMBEDDING_DIM), nullable=True)  # embedding ของข้อความ
+    image_embedding = Column(EmbeddingType(EMBEDDING_DIM), nullable=True)  # embedding ของภาพ
+    embedding_model_version = Column(String, nullable=True)  # โมเดล CLIP ที่สร้าง embedding (ดู reembed.py)
+    original_image_data = deferred(Column(LargeBinary, nullable=True))
 
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)  # ID ผู้โพสต์
     user = relationship("User", back_populates="items")  # ความสัมพันธ์ไปยังผู้ใช้
 
+    # ข้อความสำหรับ lexical match (lowercase + ตัด punctuation) Postgres คำนวณให้เองตอน insert/update
+    search_text = Column(Text, Computed(SEARCH_TEXT_SQL, persisted=True))
+
+    # HNSW index (inner product) สำหรับค้นหา nearest neighbour ใน Postgres
+    __table_args__ = (
+        Index(
+            "ix_items_text_embedding_hnsw",
+            "text_embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"text_embedding": EMBEDDING_OPS},
+        ),
+        Index(
+            "ix_items_image_embedding_hnsw",
+            "image_embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"image_embedding": EMBEDDING_OPS},
+        ),
+        # filter ของการค้นหา / รายการ lost-found
+        Index("ix_items_type_category", "type", "category"),
+        Index("ix_items_user_id", "user_id"),
+        # trigram GIN index รองรับ search_text LIKE '%word%'
+        Index(
+            "ix_items_search_text_trgm",
+            "search_text",
+            postgresql_using="gin",
+            postgresql_ops={"search_text": "gin_trgm_ops"},
+        ),
+    )
+
     
+# ======================
+# ItemMatch Model (lost <-> found ที่คำนวณไว้ล่วงหน้า)
+# ======================
+class ItemMatch(Base):
+    __tablename__ = "item_matches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), nullable=False)  # item ต้นทาง
+    matched_item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), nullable=False)  # item ฝั่งตรงข้าม
+    score = Column(Float, nullable=False)  # คะแนนรวม
+    text_score = Column(Float, nullable=True)  # cosine similarity ของ text embedding
+    image_score = Column(Float, nullable=True)  # cosine similarity ของ image embedding
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    matched_item = relationship("Item", foreign_keys=[matched_item_id], passive_deletes=True)
+
+    __table_args__ = (
+        UniqueConstraint("item_id", "matched_item_id", name="uq_item_matches_pair"),
+        Index("ix_item_matches_item_score", "item_id", "score"),
+    )
+
+
+# ======================
+# Translation cache (ไทย -> อังกฤษ)
+# ======================
+class Translation(Base):
+    __tablename__ = "translations"
+
+    source_text = Column(Text, primary_key=True)  # ข้อความต้นฉบับ (ตัดช่องว่างซ้ำแล้ว)
+    translated_text = Column(Text, nullable=False)  # ข้อความที่แปลแล้ว
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# ======================
+# ImageInferenceCache Model (ผล CLIP / YOLO ของภาพ key = SHA-256 ของไฟล์ ใช้เมื่อ IMAGE_CACHE_PERSIST=1)
+# ======================
+class ImageInferenceCache(Base):
+    __tablename__ = "image_inference_cache"
+
+    sha256 = Column(String(64), primary_key=True)  # hex digest ของ bytes ภาพ
+    model_tag = Column(String, nullable=False)  # โมเดลที่ใช้คำนวณ (เปลี่ยนโมเดล = miss)
+    image_embedding = Column(EmbeddingType(EMBEDDING_DIM), nullable=True)  # CLIP image embedding (normalise แล้ว)
+    detections = Column(JSON, nullable=True)  # กล่อง YOLO [{x1, y1, x2, y2, confidence, label}]
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# ======================
+# UploadJob Model (คิวงาน upload ที่ upload_worker ดึงไปทำ YOLO / crop / CLIP)
+# ======================
+class UploadJob(Base):
+    __tablename__ = "upload_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)  # job id ที่ส่งกลับให้ client
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)  # ผู้อัปโหลด
+    title = Column(String, nullable=False)
+    type = Column(String, nullable=False)  # lost หรือ found
+    category = Column(String, nullable=False)
+    image_data = Column(LargeBinary, nullable=True)  # ภาพต้นฉบับ (ล้างทิ้งเมื่อสร้าง item แล้ว)
+    image_filename = Column(String, nullable=False)
+    image_content_type = Column(String, nullable=False)
+
+    status = Column(String(20), nullable=False, default="queued")  # queued / processing / done / failed
+    stage = Column(String(20), nullable=True)  # detect / embed / save ระหว่าง processing
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    item_id = Column(Integer, ForeignKey("items.id", ondelete="SET NULL"), nullable=True)  # item ที่สร้างเสร็จแล้ว
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # worker ดึง job ตามลำดับ id ของสถานะ queued
+        Index("ix_upload_jobs_status_id", "status", "id"),
+    )
+
+
 # ======================
 # Chat Model
 # ======================
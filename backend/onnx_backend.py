@@ -0,0 +1,155 @@
+"""
+ONNX Runtime backend สำหรับ CLIP (text / image tower) และ YOLOv8 บน CPU
+
+- export: python -m onnx_backend [--quantize]
+  จะเขียนไฟล์ลง ONNX_MODEL_DIR:
+    clip_text.onnx / clip_image.onnx / yolo.onnx
+    และ *.int8.onnx (dynamic int8 quantisation) เมื่อใส่ --quantize
+- ใช้งาน: INFERENCE_BACKEND=onnx (และ ONNX_QUANTIZED=1 เพื่อใช้ไฟล์ int8)
+  model_registry จะโหลด session เหล่านี้แทนโมเดล torch โดย utils / yolo_predict
+  ยังเรียกผ่านฟังก์ชันเดิมทั้งหมด
+
+ต้องติดตั้งเพิ่ม: onnx, onnxruntime (export ต้องมี torch + transformers + ultralytics ด้วย)
+"""
+import argparse
+import os
+import shutil
+import numpy as np
+
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_models")
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "0") == "1"  # ต้อง export ด้วย --quantize ก่อน
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))  # 0 = ให้ ORT เลือกเอง
+
+
+def onnx_path(name: str, quantized: bool = ONNX_QUANTIZED, model_dir: str = ONNX_MODEL_DIR) -> str:
+    return os.path.join(model_dir, f"{name}.int8.onnx" if quantized else f"{name}.onnx")
+
+
+def _session(path: str):
+    import onnxruntime as ort
+
+    if not os.path.exists(path):
+        command = "python -m onnx_backend --quantize" if path.endswith(".int8.onnx") else "python -m onnx_backend"
+        raise FileNotFoundError(f"{path} not found (run: {command})")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if ONNX_INTRA_OP_THREADS:
+        options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+class OnnxClip:
+    """แทน CLIPModel: มี get_text_features / get_image_features ชื่อเดียวกัน
+    แต่รับและคืนค่าเป็น numpy array"""
+
+    def __init__(self, quantized: bool = ONNX_QUANTIZED, model_dir: str = ONNX_MODEL_DIR):
+        self.text_session = _session(onnx_path("clip_text", quantized, model_dir))
+        self.image_session = _session(onnx_path("clip_image", quantized, model_dir))
+
+    def get_text_features(self, input_ids, attention_mask):
+        feeds = {
+            "input_ids": np.asarray(input_ids, dtype=np.int64),
+            "attention_mask": np.asarray(attention_mask, dtype=np.int64),
+        }
+        return self.text_session.run(None, feeds)[0]
+
+    def get_image_features(self, pixel_values):
+        return self.image_session.run(None, {"pixel_values": np.asarray(pixel_values, dtype=np.float32)})[0]
+
+
+# ======================================================
+# export + quantisation
+# ======================================================
+def _quantize(src: str, dst: str):
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+    # ultralytics อ่าน names / imgsz จาก metadata ของไฟล์ onnx จึงต้องคัดลอกตามไปด้วย
+    source, quantized = onnx.load(src), onnx.load(dst)
+    if source.metadata_props and not quantized.metadata_props:
+        for prop in source.metadata_props:
+            quantized.metadata_props.add(key=prop.key, value=prop.value)
+        onnx.save(quantized, dst)
+    print(f"✅ Quantised {src} -> {dst}")
+
+
+def export_clip(model_dir: str = ONNX_MODEL_DIR, opset: int = 17):
+    import torch
+    import model_registry
+
+    model, processor = model_registry.load_torch_clip()
+    model = model.to("cpu").eval()
+
+    class TextTower(torch.nn.Module):
+        def __init__(self, clip_model):
+            super().__init__()
+            self.clip_model = clip_model
+
+        def forward(self, input_ids, attention_mask):
+            return self.clip_model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+    class ImageTower(torch.nn.Module):
+        def __init__(self, clip_model):
+            super().__init__()
+            self.clip_model = clip_model
+
+        def forward(self, pixel_values):
+            return self.clip_model.get_image_features(pixel_values=pixel_values)
+
+    from PIL import Image
+
+    sample = processor(text=["a black wallet", "keys"], images=Image.new("RGB", (224, 224)),
+                       return_tensors="pt", padding=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            TextTower(model), (sample["input_ids"], sample["attention_mask"]),
+            onnx_path("clip_text", False, model_dir),
+            input_names=["input_ids", "attention_mask"], output_names=["text_embeds"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "sequence"},
+                          "attention_mask": {0: "batch", 1: "sequence"},
+                          "text_embeds": {0: "batch"}},
+            opset_version=opset,
+        )
+        torch.onnx.export(
+            ImageTower(model), (sample["pixel_values"],),
+            onnx_path("clip_image", False, model_dir),
+            input_names=["pixel_values"], output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=opset,
+        )
+    print(f"✅ Exported CLIP towers to {model_dir}")
+
+
+def export_yolo(model_dir: str = ONNX_MODEL_DIR, imgsz: int = 640):
+    import model_registry
+
+    model = model_registry.load_torch_yolo()
+    exported = model.export(format="onnx", imgsz=imgsz, dynamic=False, simplify=True)
+    shutil.copy(exported, onnx_path("yolo", False, model_dir))
+    print(f"✅ Exported YOLOv8 to {model_dir}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export CLIP / YOLOv8 to ONNX (optionally int8)")
+    parser.add_argument("--output-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--models", default="clip,yolo")
+    parser.add_argument("--quantize", action="store_true", help="also write dynamic int8 *.int8.onnx")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    models = args.models.split(",")
+    names = []
+    if "clip" in models:
+        export_clip(args.output_dir)
+        names += ["clip_text", "clip_image"]
+    if "yolo" in models:
+        export_yolo(args.output_dir)
+        names.append("yolo")
+    if args.quantize:
+        for name in names:
+            _quantize(onnx_path(name, False, args.output_dir), onnx_path(name, True, args.output_dir))
+
+
+if __name__ == "__main__":
+    main()
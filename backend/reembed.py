@@ -0,0 +1,187 @@
+"""
+สร้าง text_embedding / image_embedding ของทุก item ใหม่ด้วยโมเดล CLIP ปัจจุบัน
+ใช้หลังอัปเดต CLIP_REPO / CLIP_REVISION (item ที่ embedding_model_version ตรงแล้วจะถูกข้าม)
+
+- อ่าน items ทีละ batch ผ่าน server-side cursor (yield_per) เรียงตาม id
+- embed ทั้ง batch ในครั้งเดียว แล้วเขียนกลับด้วย bulk UPDATE (executemany)
+- บันทึก checkpoint (id ล่าสุดที่เขียนแล้ว) ลงไฟล์หลังทุก batch สั่งรันซ้ำจะทำต่อจากเดิม
+- ถ้า RSS เกิน --max-memory-mb จะลดขนาด batch ลงครึ่งหนึ่ง ถ้าเหลือ 1 แล้วยังเกินจะหยุด (ทำต่อได้)
+- ลบแถวใน image_inference_cache ที่คำนวณด้วยโมเดลอื่น (model_tag ไม่ตรง) ก่อนเริ่ม
+
+รัน (จากโฟลเดอร์ backend):
+    python -m reembed --batch-size 64 --max-memory-mb 2048
+หลังรันเสร็จให้ restart server (SEARCH_ENGINE=memory โหลด index ใหม่ตอน startup)
+"""
+import argparse
+import gc
+import json
+import os
+import resource
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, delete, or_, select
+
+import image_cache
+import models
+import utils
+from database import SessionLocal, engine
+from imaging import open_image
+from model_registry import EMBEDDING_MODEL_VERSION
+
+DEFAULT_CHECKPOINT = "reembed_checkpoint.json"
+
+
+def current_rss_mb() -> float:
+    """RSS ปัจจุบันของ process (Linux อ่านจาก /proc ที่อื่นใช้ peak RSS แทน)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def load_checkpoint(path: str, version: str) -> dict:
+    if os.path.exists(path):
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("model_version") == version:
+            return checkpoint
+        print(f"[reembed] checkpoint is for {checkpoint.get('model_version')}, starting over")
+    return {"model_version": version, "last_id": 0, "processed": 0}
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    checkpoint["updated_at"] = datetime.utcnow().isoformat() + "Z"
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)  # เขียนทับแบบ atomic ไม่มีไฟล์ครึ่งๆ กลางๆ ถ้าโดน kill
+
+
+def embed_rows(rows):
+    """rows = [(id, title, image_data)] คืน list ของ dict สำหรับ bulk UPDATE
+    แถวที่เปิดภาพไม่ได้จะถูกข้าม (embedding เดิมยังอยู่)"""
+    decoded = []
+    for item_id, title, data in rows:
+        try:
+            decoded.append((item_id, title, open_image(data)))
+        except Exception as e:
+            print(f"[reembed] skip item {item_id}: cannot open image ({e})")
+    if not decoded:
+        return []
+    text_embs = utils.get_text_embeddings([title for _, title, _ in decoded])
+    image_embs = utils.get_image_embeddings([image for _, _, image in decoded])
+    return [
+        {"_id": item_id, "_text": text_emb.tolist(), "_image": image_emb.tolist()}
+        for (item_id, _, _), text_emb, image_emb in zip(decoded, text_embs, image_embs)
+    ]
+
+
+def purge_inference_cache() -> int:
+    """ลบผล CLIP / YOLO ที่ persist ไว้ของโมเดลเก่า คืนจำนวนแถวที่ลบ"""
+    table = models.ImageInferenceCache.__table__
+    with engine.begin() as conn:
+        result = conn.execute(delete(table).where(table.c.model_tag != image_cache.MODEL_TAG))
+    image_cache.image_cache.clear()
+    if result.rowcount:
+        print(f"[reembed] removed {result.rowcount} image_inference_cache rows from other models")
+    return result.rowcount
+
+
+def reembed(batch_size: int, max_memory_mb: float, checkpoint_path: str, limit: int = None) -> int:
+    """คืน exit code: 0 = เสร็จ, 2 = หยุดเพราะหน่วยความจำเกิน (รันซ้ำเพื่อทำต่อ)"""
+    version = EMBEDDING_MODEL_VERSION
+    checkpoint = load_checkpoint(checkpoint_path, version)
+    table = models.Item.__table__
+    update = (
+        table.update()
+        .where(table.c.id == bindparam("_id"))
+        .values(
+            text_embedding=bindparam("_text"),
+            image_embedding=bindparam("_image"),
+            embedding_model_version=version,
+        )
+    )
+    query = (
+        select(table.c.id, table.c.title, table.c.image_data)
+        .where(
+            table.c.id > checkpoint["last_id"],
+            or_(table.c.embedding_model_version.is_(None), table.c.embedding_model_version != version),
+        )
+        .order_by(table.c.id)
+    )
+    if limit:
+        query = query.limit(limit)
+
+    print(f"[reembed] model={version} resume_after_id={checkpoint['last_id']} batch={batch_size}")
+    purge_inference_cache()
+    start = time.perf_counter()
+    done_in_run = 0
+
+    def flush(rows):
+        nonlocal done_in_run
+        params = embed_rows(rows)
+        if params:
+            with engine.begin() as conn:
+                conn.execute(update, params)
+        checkpoint["last_id"] = rows[-1][0]
+        checkpoint["processed"] += len(params)
+        done_in_run += len(params)
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    read_session = SessionLocal()
+    try:
+        # cursor อ่านอยู่บน connection ของ read_session ส่วน UPDATE ใช้อีก connection
+        result = read_session.execute(query.execution_options(yield_per=batch_size))
+        pending = []
+        for row in result:
+            pending.append(tuple(row))
+            if len(pending) < batch_size:
+                continue
+            flush(pending)
+            pending = []
+
+            rss = current_rss_mb()
+            rate = done_in_run / (time.perf_counter() - start)
+            print(f"[reembed] {checkpoint['processed']} items (last id {checkpoint['last_id']}) "
+                  f"{rate:.1f} items/s rss={rss:.0f}MB")
+            if rss > max_memory_mb:
+                gc.collect()
+                utils.text_embedding_cache.clear()
+                if current_rss_mb() > max_memory_mb:
+                    if batch_size == 1:
+                        print(f"[reembed] RSS above {max_memory_mb}MB at batch size 1, stopping (re-run to resume)")
+                        return 2
+                    batch_size = max(1, batch_size // 2)
+                    print(f"[reembed] RSS above {max_memory_mb}MB, batch size -> {batch_size}")
+
+        if pending:
+            flush(pending)
+    finally:
+        read_session.close()
+
+    print(f"[reembed] done: {done_in_run} items in {time.perf_counter() - start:.1f}s "
+          f"(total {checkpoint['processed']})")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-embed every item with the current CLIP model")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("REEMBED_BATCH_SIZE", "64")))
+    parser.add_argument("--max-memory-mb", type=float, default=float(os.getenv("REEMBED_MAX_MEMORY_MB", "2048")))
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--limit", type=int, default=None, help="stop after N items (for trial runs)")
+    parser.add_argument("--reset", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    sys.exit(reembed(max(1, args.batch_size), args.max_memory_mb, args.checkpoint, args.limit))
+
+
+if __name__ == "__main__":
+    main()
@@ -35,9 +35,13 @@ def admin_delete_user(
     # ✅ ลบ session ที่อ้างอิงถึง user นี้ก่อน
     db.query(models.Session).filter(models.Session.user_id == user_id).delete()
 
+    # item ของ user จะถูกลบตาม (cascade) เก็บ id ไว้ลบออกจาก index
+    item_ids = [row.id for row in db.query(models.Item.id).filter(models.Item.user_id == user_id)]
+
     # ✅ ลบ user
     db.delete(user)
     db.commit()
+    crud.items_deleted(item_ids)
 
     # ✅ Log action
     crud.log_admin_action(
@@ -65,14 +69,24 @@ def admin_make_admin(target_user_id: int, admin: models.User = Depends(get_curre
 
 # ================= Items =================
 @router.get("/items")
-def admin_get_items(admin: models.User = Depends(get_current_admin), db: Session = Depends(get_db)):
-    items = db.query(models.Item).all()
+def admin_get_items(
+    include_images: bool = False,
+    admin: models.User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    # ค่าเริ่มต้นส่งแค่ URL ของ thumbnail / medium ไม่ต้องโหลดภาพต้นฉบับทุกชิ้น
+    query = db.query(models.Item)
+    if include_images:
+        query = query.options(*crud.with_images())
+    items = query.all()
     return [
         {
             "id": i.id,
             "title": i.title,
             "category": i.category,
-            "image": base64.b64encode(i.original_image_data).decode("utf-8") if i.original_image_data else None,
+            **crud.item_image_urls(i),
+            **({"image": base64.b64encode(i.original_image_data).decode("utf-8") if i.original_image_data else None}
+               if include_images else {}),
             "user_id": i.user_id
         } for i in items
     ]
@@ -86,6 +100,7 @@ def admin_delete_item(item_id: int, admin: models.User = Depends(get_current_adm
     title = item.title
     db.delete(item)
     db.commit()
+    crud.items_deleted([item_id])
     crud.log_admin_action(db, admin.id, admin.username, f"Deleted item '{title}' (ID: {item_id})", action_type="delete_post")
     return {"message": "Item deleted"}
 
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 import crud, models, schemas
 from crud import encode_image, get_current_user
 from database import get_db
+from executors import io_pool
 
 router = APIRouter(prefix="/api/chats", tags=["Chats"])
 
@@ -18,7 +19,8 @@ def get_or_create_chat(
     if current_user.id not in [chat.user1_id, chat.user2_id]:
         raise HTTPException(status_code=403, detail="You do not have access to this room")
     
-    item_image = encode_image(chat.item.image_data, chat.item.image_content_type) if chat.item else None
+    # ส่งแค่ URL ของ thumbnail ไม่แนบภาพเต็ม
+    item_thumbnail_url = crud.item_image_urls(chat.item)["thumbnail_url"] if chat.item else None
     return {
         "chat_id": chat.id,
         "user1_id": chat.user1_id,
@@ -27,7 +29,7 @@ def get_or_create_chat(
         "user2_username": chat.user2.username if chat.user2 else None,
         "created_at": chat.created_at,
         "item_id": chat.item_id, 
-        "item_image": item_image,
+        "item_thumbnail_url": item_thumbnail_url,
         "item_title": chat.item.title if chat.item else None
     }
 
@@ -46,7 +48,7 @@ def get_user_chats(
         "user2_username": c.user2.username if c.user2 else None,
         "created_at": c.created_at,
         "item_id": c.item_id if c.item else None,
-        "item_image": encode_image(c.item.image_data, c.item.image_content_type) if c.item else None,
+        "item_thumbnail_url": crud.item_image_urls(c.item)["thumbnail_url"] if c.item else None,
         "item_title": c.item.title if c.item else None
     } for c in chats]
 
@@ -85,29 +87,15 @@ def get_chat_messages(
     }
 
 # ---------------------- Send Message ----------------------
-@router.post("/messages/send", response_model=schemas.MessageOut)
-async def send_message(
-    chat_id: int = Form(...),
-    message: str = Form(""),
-    image: UploadFile = File(None),
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
+def save_message(db: Session, current_user: models.User, chat_id: int, message: str,
+                 image_data: bytes, image_content_type: str, image_filename: str) -> schemas.MessageOut:
+    """ตรวจสิทธิ์ห้องแชท + insert ข้อความ + สร้าง response (sync, รันใน io_pool)"""
     chat = db.query(models.Chat).filter(models.Chat.id == chat_id).first()
     if not chat:
         raise HTTPException(status_code=404, detail="Chat room not found")
     if current_user.id not in [chat.user1_id, chat.user2_id]:
         raise HTTPException(status_code=403, detail="You do not have access to this room")
 
-    image_data = None
-    image_content_type = None
-    image_filename = None
-
-    if image:
-        image_data = await image.read()
-        image_content_type = image.content_type
-        image_filename = image.filename
-
     msg = crud.create_message(
         db,
         sender_id=current_user.id,
@@ -129,6 +117,28 @@ async def send_message(
         image_filename=msg.image_filename
     )
 
+@router.post("/messages/send", response_model=schemas.MessageOut)
+async def send_message(
+    chat_id: int = Form(...),
+    message: str = Form(""),
+    image: UploadFile = File(None),
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    image_data = None
+    image_content_type = None
+    image_filename = None
+
+    if image:
+        image_data = await image.read()
+        image_content_type = image.content_type
+        image_filename = image.filename
+
+    # insert + base64 ของรูปใน io_pool (ไม่ block event loop)
+    return await io_pool.run(
+        save_message, db, current_user, chat_id, message, image_data, image_content_type, image_filename
+    )
+
 # ---------------------- Delete Message ----------------------
 @router.delete("/messages/{message_id}/delete")
 def delete_message(
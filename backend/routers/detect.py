@@ -1,50 +1,73 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
-from ultralytics import YOLO
-from PIL import Image
-import io
-import torch
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from sqlalchemy.orm import Session
+import asyncio
 import os
-import models, crud
-from crud import get_current_user
-from transformers import CLIPModel, CLIPProcessor
-from huggingface_hub import hf_hub_download
+import time
+import models, crud, utils
+import image_cache
+import frame_cache
+from imaging import ImageTooLarge, decode_image, scale_detections
+from crud import ALLOWED_ORIGINS, get_current_user
+from database import SessionLocal, get_db
+from model_registry import ModelNotReady, yolo_detect
+from executors import ExecutorSaturated, inference_pool, io_pool
+from routers.search import nearest_items
 
 router = APIRouter(prefix="/detect", tags=["Detect"])
 
-# ===============================
-# โหลด YOLOv8 + CLIP Fine-tuned
-# ===============================
-HF_TOKEN = os.getenv("HF_TOKEN")  # ต้องมีใน .env
-
-# ---- โหลด YOLOv8 จาก Hugging Face (private repo) ----
-try:
-    print("🚀 Downloading YOLOv8 weights from Hugging Face (private repo)...")
-    model_path = hf_hub_download(
-        repo_id="freemanlnwza/modelYOLOv8",  # repo ชื่อเต็ม
-        filename="weights/best.pt",           # path ใน repo
-        token=HF_TOKEN                        # token สำหรับ private access
-    )
-    yolo_model = YOLO(model_path)
-    print("✅ YOLOv8 model loaded successfully.")
-except Exception as e:
-    print(f"❌ Failed to load YOLOv8 model: {e}")
-    raise RuntimeError("Cannot load YOLOv8 model from Hugging Face (check token & repo name).")
-
-# ---- โหลด CLIP fine-tuned ----
-try:
-    clip_model = CLIPModel.from_pretrained(
-        "freemanlnwza/modelCLIPfine-tuned",
-        token=HF_TOKEN
-    )
-    clip_processor = CLIPProcessor.from_pretrained(
-        "freemanlnwza/modelCLIPfine-tuned",
-        token=HF_TOKEN
-    )
-    print("✅ CLIP fine-tuned model loaded.")
-except Exception as e:
-    print(f"⚠️ Failed to load CLIP model: {e}")
-    clip_model = None
-    clip_processor = None
+# YOLOv8 + CLIP fine-tuned มาจาก model_registry (แชร์กับ /api/upload และ /api/search)
+
+
+def decode_frame(image_bytes: bytes):
+    """decode ภาพ (ย่อด้วย imaging.decode_image) + dHash สำหรับ frame_cache
+    คืน (PIL image, scale, frame_hash)"""
+    pil_image, scale = decode_image(image_bytes)
+    return pil_image, scale, frame_cache.dhash(pil_image)
+
+
+def detect_objects(pil_image, scale: float) -> list:
+    """YOLO detect คืน list ของ detection พิกัดกล่องอยู่ในระบบพิกัดของภาพต้นฉบับเสมอ"""
+    return scale_detections(yolo_detect(pil_image), scale)
+
+
+def crop_detections(pil_image, detections: list, scale: float = 1.0, padding: int = 5) -> list:
+    """ตัดภาพตามกรอบของแต่ละ detection (ขยายขอบเท่ากับตอน upload)
+    scale: ขนาดภาพต้นฉบับ / ขนาดของ pil_image"""
+    crops = []
+    for d in detections:
+        box = (
+            max(int(d["x1"] / scale) - padding, 0),
+            max(int(d["y1"] / scale) - padding, 0),
+            min(int(d["x2"] / scale) + padding, pil_image.width),
+            min(int(d["y2"] / scale) + padding, pil_image.height),
+        )
+        crops.append(pil_image.crop(box))
+    return crops
+
+
+def embed_crops(pil_image, detections: list, scale: float = 1.0) -> list:
+    """ทุก crop ผ่าน CLIP ใน forward pass เดียว"""
+    return utils.get_image_embeddings(crop_detections(pil_image, detections, scale))
+
+
+def match_crops(db: Session, embeddings: list, k: int, match_type: str = None) -> list:
+    """item ใน catalog ที่ใกล้ embedding ของแต่ละ crop ที่สุด k รายการ"""
+    filters = {"type": match_type}
+    return [
+        [
+            {
+                "id": item.id,
+                "title": item.title,
+                "type": item.type,
+                "category": item.category,
+                "user_id": item.user_id,
+                "username": item.user.username if item.user else None,
+                "similarity": round(sim, 4),
+            }
+            for item, sim in nearest_items(db, "image", emb, k, filters=filters)
+        ]
+        for emb in embeddings
+    ]
 
 
 # ===============================
@@ -53,50 +76,166 @@ except Exception as e:
 @router.post("/frame")
 async def detect_frame(
     image: UploadFile = File(...),
-    current_user: models.User = Depends(get_current_user)
+    crops: bool = Form(False),
+    match_top_k: int = Form(0),
+    match_type: str = Form(None),
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
+    """crops=true: embed แต่ละ detection แยกกัน (คืน embedding ต่อกล่อง)
+    match_top_k > 0: แนบ item ที่ใกล้ที่สุดของแต่ละกล่อง (กรองด้วย match_type ได้)"""
     # ตรวจสอบไฟล์ภาพ
     if not image.filename.lower().endswith((".jpg", ".jpeg", ".png")):
         raise HTTPException(status_code=400, detail="File must be an image (jpg, jpeg, png)")
+    if match_type and match_type not in ("lost", "found"):
+        raise HTTPException(status_code=400, detail="match_type must be 'lost' or 'found'")
 
-    # อ่านภาพเป็น PIL
+    # อ่านภาพ แล้ว decode + dHash ใน inference_pool (ไม่ block event loop)
     image_bytes = await image.read()
-    pil_image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    try:
+        pil_image, scale, frame_hash = await inference_pool.run(decode_frame, image_bytes)
+    except (ExecutorSaturated, ImageTooLarge):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Cannot read image: {e}")
+
+    # frame แทบเหมือน frame ก่อนหน้าของ user คนเดิม: คืนผลเดิมเลย ไม่รัน YOLO / CLIP
+    variant = (crops, match_top_k, match_type)
+    cached = frame_cache.lookup(current_user.id, frame_hash, variant)
+    if cached is not None:
+        return {"user": current_user.username, **cached, "cached": True}
+
+    # YOLO (รูปที่เคยตรวจแล้วใช้กล่องจาก image_cache)
+    image_key = await image_cache.adigest(image_bytes)
+    detections = await image_cache.aget_detections(db, image_key)
+    if detections is None:
+        try:
+            detections = await inference_pool.run(detect_objects, pil_image, scale)
+        except (ModelNotReady, ExecutorSaturated):
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"YOLO detection failed: {e}")
+        await image_cache.aput_detections(db, image_key, detections)
 
     # ===============================
-    # YOLO detect
+    # CLIP embedding ต่อ crop (crops=true และมี detection)
     # ===============================
-    try:
-        results = yolo_model.predict(pil_image)
-        detections = []
-        if results and len(results[0].boxes) > 0:
-            for box in results[0].boxes:
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                conf = float(box.conf[0])
-                cls = int(box.cls[0])
-                label = results[0].names[cls]
-                detections.append({
-                    "x1": x1, "y1": y1, "x2": x2, "y2": y2,
-                    "confidence": conf,
-                    "label": label
-                })
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"YOLO detection failed: {e}")
+    if crops and detections:
+        embeddings = await inference_pool.run(embed_crops, pil_image, detections, scale)
+        for detection, emb in zip(detections, embeddings):
+            detection["embedding"] = emb.tolist()
+        if match_top_k > 0:
+            if crud.items_sync_due():
+                await io_pool.run(crud.sync_items, db)
+            matches = await io_pool.run(match_crops, db, embeddings, min(match_top_k, 20), match_type)
+            for detection, items in zip(detections, matches):
+                detection["matches"] = items
+        payload = {"detections": detections, "clip_embedding": None}
+        frame_cache.store(current_user.id, frame_hash, payload, variant)
+        return {"user": current_user.username, **payload, "cached": False}
 
     # ===============================
-    # CLIP embedding (optional)
+    # CLIP embedding ทั้งภาพ (optional)
     # ===============================
     clip_embedding = None
-    if clip_model and clip_processor:
-        try:
-            inputs = clip_processor(images=pil_image, return_tensors="pt")
-            with torch.no_grad():
-                clip_embedding = clip_model.get_image_features(**inputs).tolist()
-        except Exception as e:
-            print(f"[⚠️ Warning] CLIP embedding failed: {e}")
+    try:
+        clip_embedding = [(await image_cache.aget_image_embedding(db, image_bytes, pil_image, image_key)).tolist()]
+    except ModelNotReady:
+        raise
+    except Exception as e:
+        print(f"[⚠️ Warning] CLIP embedding failed: {e}")
+
+    payload = {"detections": detections, "clip_embedding": clip_embedding}
+    if clip_embedding is not None:
+        frame_cache.store(current_user.id, frame_hash, payload, variant)
+    return {"user": current_user.username, **payload, "cached": False}
+
+
+# ===============================
+# WebSocket /stream (กล้องแบบต่อเนื่อง)
+# ===============================
+# ยืนยันตัวตนครั้งเดียวตอนเชื่อมต่อ แล้วรับ frame เป็น binary (JPEG/PNG)
+# ถ้า frame ใหม่มาถึงระหว่างที่ YOLO ยังทำงาน frame ที่รออยู่จะถูกแทนที่ (latest-wins)
+# latency จึงเท่ากับเวลา inference ไม่สะสมเป็นคิว
+WS_MAX_FRAME_BYTES = int(os.getenv("WS_MAX_FRAME_BYTES", str(2 * 1024 * 1024)))
 
-    return {
-        "user": current_user.username,
-        "detections": detections,
-        "clip_embedding": clip_embedding
-    }
+
+def _websocket_user(websocket: WebSocket):
+    token = websocket.cookies.get("session_token")
+    if not token:
+        return None
+    db = SessionLocal()
+    try:
+        return crud.get_user_by_session_token(db, token)
+    finally:
+        db.close()
+
+
+@router.websocket("/stream")
+async def detect_stream(websocket: WebSocket):
+    origin = websocket.headers.get("origin")
+    if origin and origin not in ALLOWED_ORIGINS:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    user = await io_pool.run(_websocket_user, websocket)
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+
+    latest = {"frame": None, "seq": 0, "dropped": 0}
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            data = message.get("bytes")
+            if not data or len(data) > WS_MAX_FRAME_BYTES:
+                continue
+            if latest["frame"] is not None:
+                latest["dropped"] += 1
+            latest["frame"] = data
+            latest["seq"] += 1
+            frame_ready.set()
+
+    async def process_frames():
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            frame, seq = latest["frame"], latest["seq"]
+            latest["frame"] = None
+            start = time.perf_counter()
+            try:
+                pil_image, scale, frame_hash = await inference_pool.run(decode_frame, frame)
+                detections = frame_cache.lookup(user.id, frame_hash, "stream")
+                cached = detections is not None
+                if not cached:
+                    detections = await inference_pool.run(detect_objects, pil_image, scale)
+                    frame_cache.store(user.id, frame_hash, detections, "stream")
+            except (ModelNotReady, ExecutorSaturated, ImageTooLarge) as e:
+                await websocket.send_json({"frame": seq, "error": str(e)})
+                continue
+            except Exception as e:
+                await websocket.send_json({"frame": seq, "error": f"YOLO detection failed: {e}"})
+                continue
+            await websocket.send_json({
+                "frame": seq,
+                "detections": detections,
+                "dropped": latest["dropped"],
+                "cached": cached,
+                "inference_ms": round((time.perf_counter() - start) * 1000, 1),
+            })
+
+    receiver = asyncio.create_task(receive_frames())
+    processor = asyncio.create_task(process_frames())
+    try:
+        done, _ = await asyncio.wait({receiver, processor}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not task.cancelled() and isinstance(task.exception(), Exception) \
+                    and not isinstance(task.exception(), WebSocketDisconnect):
+                print(f"[⚠️ Warning] detect stream closed: {task.exception()}")
+    finally:
+        receiver.cancel()
+        processor.cancel()
@@ -0,0 +1,41 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+import executors
+import frame_cache
+import model_registry
+import upload_worker
+import utils
+
+router = APIRouter(tags=["Health"])
+
+
+# ===============================
+# liveness: process ยังตอบได้ (ไม่รอโมเดล)
+# ===============================
+@router.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+
+# ===============================
+# readiness: 200 เมื่อ CLIP + YOLO โหลดและ warm-up เสร็จแล้ว ไม่งั้น 503
+# ===============================
+@router.get("/readyz")
+def readyz():
+    ready = model_registry.all_ready()
+    body = {"status": "ready" if ready else "not_ready", "models": model_registry.status()}
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+
+# ===============================
+# metrics: queue depth ของ executor pool + micro-batcher + frame cache + upload worker
+# ===============================
+@router.get("/metrics")
+def metrics():
+    return {
+        "executors": executors.stats(),
+        "batching": utils.inference_stats(),
+        "models": model_registry.status(),
+        "frame_cache": frame_cache.stats(),
+        "upload_worker": upload_worker.stats(),
+    }
@@ -1,38 +1,90 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Request, Response
 from sqlalchemy.orm import Session
-import io, os
-from PIL import Image, ImageDraw, ImageFont
-from ultralytics import YOLO
-from huggingface_hub import hf_hub_download
-import crud, schemas, utils
-from crud import encode_image, get_current_user 
+import hashlib, os
+import crud, schemas
+from crud import boxed_image_url, encode_image, get_current_user, item_image_urls 
 from database import get_db
 import models
+import matching
+import upload_worker
+from imaging import ImageTooLarge, probe_image
+from executors import io_pool
 
 router = APIRouter(prefix="/api", tags=["Items"])
 
+# ภาพของ item cache ได้แค่ใน browser (private) ไม่นาน + ETag ให้ตรวจซ้ำด้วย 304
+# ไม่ใช้ public / max-age ยาว เพราะ proxy จะเสิร์ฟภาพของ item ที่ถูกลบแล้วต่อ
+IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", "300"))  # วินาที
+
 # ============================
-# โหลด YOLOv8 จาก Hugging Face (private repo)
+# ItemOut
 # ============================
-HF_TOKEN = os.getenv("HF_TOKEN")
-
-try:
-    print("🚀 Loading YOLOv8 model for /upload ...")
-    model_path = hf_hub_download(
-        repo_id="freemanlnwza/modelYOLOv8",  # Hugging Face repo name
-        filename="weights/best.pt",
-        token=HF_TOKEN
+def item_out(i: models.Item, include_images: bool = False, **extra) -> schemas.ItemOut:
+    """ค่าเริ่มต้นส่งแค่ URL ของภาพ (thumbnail_url / medium_url ...) include_images=True แนบ base64 ภาพเต็มแบบเดิม"""
+    images = {}
+    if include_images:
+        images = dict(
+            image_data=encode_image(i.image_data, i.image_content_type),
+            boxed_image_data=encode_image(i.boxed_image_data, "image/png"),
+            original_image_data=encode_image(i.original_image_data, i.image_content_type),
+        )
+    return schemas.ItemOut(
+        id=i.id,
+        title=i.title,
+        type=i.type,
+        category=i.category,
+        image_filename=i.image_filename,
+        user_id=i.user_id,
+        username=i.user.username if i.user else None,
+        boxed_image_url=boxed_image_url(i),
+        detections=i.detections,
+        **item_image_urls(i),
+        **images,
+        **extra
     )
-    yolo_model = YOLO(model_path)
-    print("✅ YOLOv8 model loaded successfully!")
-except Exception as e:
-    print(f"❌ Failed to load YOLO model: {e}")
-    raise RuntimeError("Cannot load YOLO model from Hugging Face (check token or repo name).")
+
 
 # ============================
 # Upload item
 # ============================
-@router.post("/upload", response_model=schemas.ItemOut)
+# บันทึกภาพต้นฉบับเป็น job แล้วตอบ 202 ทันที YOLO / crop / CLIP ทำใน upload_worker
+# client ถามสถานะได้ที่ GET /api/upload/{job_id}
+def enqueue_upload(db: Session, user_id: int, title: str, type: str, category: str,
+                   image_filename: str, image_content_type: str, image_bytes: bytes) -> models.UploadJob:
+    job = models.UploadJob(
+        user_id=user_id,
+        title=title,
+        type=type,
+        category=category,
+        image_data=image_bytes,
+        image_filename=image_filename,
+        image_content_type=image_content_type,
+        status="queued",
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def upload_job_out(db: Session, job: models.UploadJob) -> schemas.UploadJobOut:
+    out = schemas.UploadJobOut(
+        job_id=job.id, status=job.status, stage=job.stage, attempts=job.attempts, error=job.error
+    )
+    if job.status == "queued":
+        out.queue_position = (
+            db.query(models.UploadJob)
+            .filter(models.UploadJob.status == "queued", models.UploadJob.id < job.id)
+            .count()
+        )
+    if job.status == "done" and job.item_id:
+        item = db.get(models.Item, job.item_id)
+        if item:
+            out.item = item_out(item, include_images=True)
+    return out
+
+
+@router.post("/upload", response_model=schemas.UploadJobOut, status_code=202)
 async def upload_item(
     title: str = Form(...),
     type: str = Form(...),
@@ -45,147 +97,106 @@ async def upload_item(
     if not image.filename.lower().endswith((".jpg", ".jpeg", ".png")):
         raise HTTPException(status_code=400, detail="File must be an image (jpg, jpeg, png)")
 
-    # อ่านภาพต้นฉบับ
+    # อ่านภาพต้นฉบับ แล้วตรวจแค่ header (ขนาด / เปิดได้) ก่อนรับเข้าคิว
     image_bytes = await image.read()
-    pil_image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-
-    # ตรวจจับวัตถุด้วย YOLO
-    results = yolo_model.predict(pil_image)
-    result = results[0]
-
-    boxes = result.boxes.xyxy.cpu().numpy()
-    labels = result.boxes.cls.cpu().numpy()
-    confs = result.boxes.conf.cpu().numpy()
-    class_names = result.names
-
-    if len(boxes) > 0:
-        padding = 5
-        mask = Image.new("L", pil_image.size, 0)
-        draw_mask = ImageDraw.Draw(mask)
-
-        for (x1, y1, x2, y2) in boxes:
-            draw_mask.rectangle(
-                [
-                    max(int(x1) - padding, 0),
-                    max(int(y1) - padding, 0),
-                    min(int(x2) + padding, pil_image.width),
-                    min(int(y2) + padding, pil_image.height),
-                ],
-                fill=255,
-            )
-
-        rgba_image = pil_image.convert("RGBA")
-        rgba_image.putalpha(mask)
-        crop_box = rgba_image.getbbox()
-        cropped_image = rgba_image.crop(crop_box)
-
-        cropped_io = io.BytesIO()
-        cropped_image.convert("RGB").save(cropped_io, format="PNG")
-        cropped_image_bytes = cropped_io.getvalue()
-
-        # วาดกรอบและ label
-        final_image = cropped_image.copy()
-        draw_final = ImageDraw.Draw(final_image)
-        try:
-            font = ImageFont.truetype("arial.ttf", size=16)
-        except:
-            font = ImageFont.load_default()
-
-        crop_left, crop_upper = crop_box[0], crop_box[1]
-
-        for i, (x1, y1, x2, y2) in enumerate(boxes):
-            rect_x1 = max(int(x1) - padding - crop_left, 0)
-            rect_y1 = max(int(y1) - padding - crop_upper, 0)
-            rect_x2 = min(int(x2) + padding - crop_left, final_image.width - 1)
-            rect_y2 = min(int(y2) + padding - crop_upper, final_image.height - 1)
-
-            draw_final.rectangle([rect_x1, rect_y1, rect_x2, rect_y2], outline="red", width=3)
-            label_text = f"{class_names[int(labels[i])]} {confs[i]:.2f}"
-            draw_final.text((rect_x1, max(rect_y1 - 16, 0)), label_text, fill="white", font=font)
-
-        boxed_io = io.BytesIO()
-        final_image.convert("RGB").save(boxed_io, format="PNG")
-        boxed_image_bytes = boxed_io.getvalue()
-    else:
-        cropped_image_bytes = image_bytes
-        boxed_image_bytes = image_bytes
-        confs = []
-
-    # บันทึกลงฐานข้อมูล
-    item_in = schemas.ItemCreate(title=title, type=type, category=category)
-    item = crud.create_item(
-        db=db,
-        item=item_in,
-        image_bytes=cropped_image_bytes,
-        image_filename=image.filename,
-        image_content_type=image.content_type,
-        user_id=current_user.id,
-        boxed_image_data=boxed_image_bytes,
-        original_image_data=image_bytes,
-        image_emb=utils.validate_image_embedding(cropped_image_bytes)
+    try:
+        probe_image(image_bytes)
+    except ImageTooLarge:
+        raise
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cannot read image file")
+
+    job = await io_pool.run(
+        enqueue_upload, db, current_user.id, title, type, category,
+        image.filename, image.content_type, image_bytes,
     )
+    upload_worker.wake()
+    return await io_pool.run(upload_job_out, db, job)
 
-    return schemas.ItemOut(
-        id=item.id,
-        title=item.title,
-        type=item.type,
-        category=item.category,
-        image_data=encode_image(item.image_data, item.image_content_type),
-        boxed_image_data=encode_image(item.boxed_image_data, "image/png"),
-        original_image_data=encode_image(item.original_image_data, item.image_content_type),
-        image_filename=item.image_filename,
-        user_id=item.user_id,
-        username=item.user.username if item.user else None,
-        confidence_list=confs.tolist() if hasattr(confs, "tolist") else confs
-    )
+
+@router.get("/upload/{job_id}", response_model=schemas.UploadJobOut)
+def get_upload_job(
+    job_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    job = db.get(models.UploadJob, job_id)
+    if job is None or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return upload_job_out(db, job)
 
 # ============================
 # Get lost items
 # ============================
 @router.get("/lost-items", response_model=list[schemas.ItemOut])
-def get_lost_items(db: Session = Depends(get_db)):
-    items = crud.get_items(db, type_filter="lost")
-    return [
-        schemas.ItemOut(
-            id=i.id,
-            title=i.title,
-            type=i.type,
-            category=i.category,
-            image_data=encode_image(i.image_data, i.image_content_type),
-            boxed_image_data=encode_image(i.boxed_image_data, i.image_content_type),
-            original_image_data=encode_image(i.original_image_data, i.image_content_type) if i.original_image_data else None,
-            image_filename=i.image_filename,
-            user_id=i.user_id,
-            username=i.user.username if i.user else None
-        )
-        for i in items
-    ]
+def get_lost_items(include_images: bool = False, db: Session = Depends(get_db)):
+    items = crud.get_items(db, type_filter="lost", include_images=include_images)
+    return [item_out(i, include_images) for i in items]
 
 # ============================
 # Get my items
 # ============================
 @router.get("/items/user", response_model=list[schemas.ItemOut])
 def get_my_items(
+    include_images: bool = False,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    items = db.query(models.Item).filter(models.Item.user_id == current_user.id).all()
+    query = db.query(models.Item).filter(models.Item.user_id == current_user.id)
+    if include_images:
+        query = query.options(*crud.with_images())
+    return [item_out(i, include_images) for i in query.all()]
+
+# ============================
+# Get matches of an item
+# ============================
+@router.get("/items/{item_id}/matches", response_model=list[schemas.ItemOut])
+def get_item_matches(
+    item_id: int,
+    limit: int = matching.MATCH_TOP_K,
+    include_images: bool = False,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    item = db.query(models.Item).filter(models.Item.id == item_id).first()
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+
     return [
-        schemas.ItemOut(
-            id=i.id,
-            title=i.title,
-            type=i.type,
-            category=i.category,
-            image_data=encode_image(i.image_data, i.image_content_type),
-            boxed_image_data=encode_image(i.boxed_image_data, i.image_content_type),
-            original_image_data=encode_image(i.original_image_data, i.image_content_type) if i.original_image_data else None,
-            image_filename=i.image_filename,
-            user_id=i.user_id,
-            username=i.user.username if i.user else None
-        )
-        for i in items
+        item_out(m.matched_item, include_images, similarity=round(m.score, 4))
+        for m in matching.get_matches(db, item_id, limit, include_images)
     ]
 
+# ============================
+# ภาพของ item (thumbnail / medium / image / original)
+# ============================
+def image_response(request: Request, data: bytes, media_type: str) -> Response:
+    """ตอบภาพพร้อม ETag (304 ถ้า browser มีอยู่แล้ว) เรียกหลังยืนยันว่า item ยังอยู่เท่านั้น"""
+    etag = f'"{hashlib.md5(data).hexdigest()}"'
+    headers = {"Cache-Control": f"private, max-age={IMAGE_CACHE_MAX_AGE}", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=media_type, headers=headers)
+
+@router.get("/items/{item_id}/image/{variant}")
+def get_item_image(item_id: int, variant: str, request: Request, db: Session = Depends(get_db)):
+    if variant not in crud.ITEM_IMAGE_VARIANTS:
+        raise HTTPException(status_code=404, detail="Unknown image variant")
+    image = crud.get_item_image(db, item_id, variant)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return image_response(request, *image)
+
+# ============================
+# Boxed image (render จาก detections ตอนขอ)
+# ============================
+@router.get("/items/{item_id}/boxed")
+def get_boxed_image(item_id: int, request: Request, db: Session = Depends(get_db)):
+    boxed = crud.get_boxed_image(db, item_id)
+    if boxed is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return image_response(request, *boxed)
+
 # ============================
 # Delete item
 # ============================
@@ -202,6 +213,7 @@ def delete_item(
         raise HTTPException(status_code=403, detail="Cannot delete others' items")
     db.delete(item)
     db.commit()
+    crud.items_deleted([item_id])
     return {"message": "Item deleted successfully"}
 
 # ============================
@@ -209,21 +221,9 @@ def delete_item(
 # ============================
 @router.get("/found-items", response_model=list[schemas.ItemOut])
 def get_found_items(
+    include_images: bool = False,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    items = crud.get_items(db, type_filter="found")
-    return [
-        schemas.ItemOut(
-            id=i.id,
-            title=i.title,
-            type=i.type,
-            category=i.category,
-            image_data=encode_image(i.image_data, i.image_content_type),
-            boxed_image_data=encode_image(i.boxed_image_data, i.image_content_type),
-            image_filename=i.image_filename,
-            user_id=i.user_id,
-            username=i.user.username if i.user else None
-        )
-        for i in items
-    ]
+    items = crud.get_items(db, type_filter="found", include_images=include_images)
+    return [item_out(i, include_images) for i in items]
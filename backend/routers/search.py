@@ -1,110 +1,317 @@
 from fastapi import APIRouter, Depends, Form, File, UploadFile, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import Float, case, cast, func, literal, or_, select, union
+from sqlalchemy import text as sql_text
+from sqlalchemy.orm import Session, joinedload
 import string
-import requests
 import os
+import asyncio
 import numpy as np
 
-from utils import get_image_embedding, get_text_embedding, cosine_similarity  # ใช้ Hugging Face Inference API
-from crud import encode_image
+from utils import aget_image_embedding, aget_text_embedding, get_text_image_embeddings
+import crud
+from crud import boxed_image_url, encode_image, item_image_urls
 from database import get_db
 import models, schemas
+from models import embedding_distance, embedding_similarity
+import utils
+import vector_index
+import translation
+import image_cache
+from cache import LRUCache
+from executors import inference_pool, io_pool
+from translation import contains_thai, translate_to_english
 
-HF_TOKEN = os.getenv("HF_TOKEN")
+# จำนวน candidate ที่ดึงจาก HNSW index ต่อ query ก่อน re-rank
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "50"))
+# ขนาด candidate list ของ HNSW ตอนค้นหา (ยิ่งมากยิ่งแม่น แต่ช้าลง)
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+# small epsilon so we never kill sim to 0 completely when there's no text match
+SEARCH_LEXICAL_EPS = float(os.getenv("SEARCH_LEXICAL_EPS", "0.15"))
+# pgvector >= 0.8: สแกน HNSW ต่อจนได้ครบ k แถวเมื่อมี WHERE (relaxed_order / strict_order)
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN", "")
+# น้ำหนักเริ่มต้นของคะแนนข้อความ / ภาพ เมื่อค้นหาด้วยทั้งสองอย่าง
+SEARCH_TEXT_WEIGHT = float(os.getenv("SEARCH_TEXT_WEIGHT", "0.5"))
+SEARCH_IMAGE_WEIGHT = float(os.getenv("SEARCH_IMAGE_WEIGHT", "0.5"))
 
-router = APIRouter(prefix="/api", tags=["Search"])
+# cache ผลค้นหาทั้งชุด (รวมรูป base64) key มี generation ของ items อยู่ด้วย
+# สร้าง/ลบ item เมื่อไหร่ ผลเก่าจะไม่ถูกใช้อีก
+search_result_cache = LRUCache(
+    maxsize=int(os.getenv("SEARCH_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "300")),
+)
 
-def translate_to_english(text: str):
-    """Translate Thai -> English using Hugging Face Inference API"""
-    if any('\u0E00' <= ch <= '\u0E7F' for ch in text):
-        url = "https://router.huggingface.co/hf-inference/models/Helsinki-NLP/opus-mt-th-en"
-        headers = {"Authorization": f"Bearer {HF_TOKEN}"}
-        payload = {"inputs": text}
-        response = requests.post(url, headers=headers, json=payload)
-        if response.status_code == 200:
-            translated_text = response.json()[0]['translation_text']
-            # ตัด punctuation ที่ปลาย string
-            translated_text = translated_text.strip().rstrip(string.punctuation)
-            return translated_text
-        else:
-            print(f"[⚠️ Warning] Translation API error: {response.status_code} {response.text}")
-            return text
-    return text
+router = APIRouter(prefix="/api", tags=["Search"])
 
 def normalize_text(text: str) -> str:
     """Lowercase และลบ punctuation + extra spaces"""
     return text.lower().translate(str.maketrans("", "", string.punctuation)).strip()
 
+def _set_ef_search(db: Session, limit: int, filtered: bool = False):
+    # ef_search ต้องไม่น้อยกว่า limit ไม่งั้น index จะคืนผลไม่ครบ (pgvector รับได้สูงสุด 1000)
+    db.execute(sql_text(f"SET LOCAL hnsw.ef_search = {min(max(HNSW_EF_SEARCH, limit), 1000)}"))
+    if filtered and HNSW_ITERATIVE_SCAN:
+        db.execute(sql_text(f"SET LOCAL hnsw.iterative_scan = {HNSW_ITERATIVE_SCAN}"))
+
+def filter_clauses(filters: dict) -> list:
+    """แปลง filters (type / category / user_id) เป็น WHERE clause"""
+    item = models.Item
+    clauses = []
+    if filters.get("type"):
+        clauses.append(item.type == filters["type"])
+    if filters.get("category"):
+        clauses.append(item.category == filters["category"])
+    if filters.get("user_id") is not None:
+        clauses.append(item.user_id == filters["user_id"])
+    return clauses
+
+def lexical_match(words: list[str]):
+    """SQL expression: สัดส่วนคำใน query ที่พบใน items.search_text (0..1)
+    search_text เป็น generated column ที่มี trigram GIN index รองรับ LIKE '%word%'"""
+    if not words:
+        return literal(0.0, Float)
+    hits = [case((models.Item.search_text.contains(w, autoescape=True), 1), else_=0) for w in words]
+    return cast(sum(hits[1:], hits[0]), Float) / len(words)
+
+def hybrid_score(query_emb, words: list[str], eps: float):
+    """SQL expression: cosine similarity * (eps + (1 - eps) * lexical match)"""
+    similarity = embedding_similarity(models.Item.text_embedding, query_emb)
+    return func.coalesce(similarity, 0.0) * (eps + (1.0 - eps) * lexical_match(words))
+
+def _item_options(include_images: bool = False) -> list:
+    """user ของ item + (ถ้าขอ) คอลัมน์ภาพเต็มที่เป็น deferred ใน query เดียวกัน"""
+    return [joinedload(models.Item.user), *(crud.with_images() if include_images else [])]
+
+def nearest_items(db: Session, kind: str, query_emb, limit: int, offset: int = 0, filters: dict = None,
+                  include_images: bool = False):
+    """ดึง item ที่ใกล้ query_emb ที่สุดทั้งตาราง kind = "text" หรือ "image"
+    คืนค่าเป็น list ของ (item, cosine similarity) เรียงจากมากไปน้อย"""
+    filters = filters or {}
+    if vector_index.ENABLED:
+        hits = vector_index.get_index(kind).search(query_emb, offset + limit, **filters)[offset:]
+        return _items_for_hits(db, hits, include_images)
+
+    # pgvector: ORDER BY embedding <#> q LIMIT k ผ่าน HNSW index (<#> = -inner product)
+    column = models.Item.text_embedding if kind == "text" else models.Item.image_embedding
+    clauses = filter_clauses(filters)
+    _set_ef_search(db, offset + limit, filtered=bool(clauses))
+    distance = embedding_distance(column, query_emb)
+    rows = (
+        db.query(models.Item, distance.label("distance"))
+        .options(*_item_options(include_images))
+        .filter(column.isnot(None), *clauses)
+        .order_by(distance)
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    return [(item, -float(dist)) for item, dist in rows]
+
+def _items_for_hits(db: Session, hits, include_images: bool = False):
+    """ดึงแถวจริงจาก DB ด้วย id ของผลจาก in-memory index (query เดียว)"""
+    if not hits:
+        return []
+    items = (
+        db.query(models.Item)
+        .options(*_item_options(include_images))
+        .filter(models.Item.id.in_([item_id for item_id, _ in hits]))
+        .all()
+    )
+    by_id = {i.id: i for i in items}
+    return [(by_id[item_id], sim) for item_id, sim in hits if item_id in by_id]
+
+def hybrid_search(db: Session, variants, limit: int, top_k: int, offset: int = 0,
+                  filters: dict = None, image_emb=None, text_weight: float = SEARCH_TEXT_WEIGHT,
+                  image_weight: float = SEARCH_IMAGE_WEIGHT, eps: float = SEARCH_LEXICAL_EPS,
+                  include_images: bool = False):
+    """จัดอันดับแบบ lexical + vector ใน SQL เดียว
+    variants = [(query embedding, [คำใน query]), ...] ใช้คะแนนที่ดีที่สุดของทุกเวอร์ชัน
+    ถ้ามี image_emb ด้วย คะแนนสุดท้าย = text_weight * คะแนนข้อความ + image_weight * คะแนนภาพ
+    คืนค่าเป็น list ของ (item, score) เรียงจากมากไปน้อย"""
+    item = models.Item
+    filters = filters or {}
+    clauses = filter_clauses(filters)
+    scores = [hybrid_score(q_emb, words, eps) for q_emb, words in variants]
+    score = scores[0] if len(scores) == 1 else func.greatest(*scores)
+    if image_emb is not None:
+        image_score = func.coalesce(embedding_similarity(item.image_embedding, image_emb), 0.0)
+        total_weight = (text_weight + image_weight) or 1.0
+        score = (text_weight * score + image_weight * image_score) / total_weight
+    score = score.label("score")
+
+    if vector_index.ENABLED:
+        # candidate จาก in-memory index แล้วให้ SQL คิดคะแนนรวมเฉพาะแถวเหล่านั้น
+        candidate_ids = {
+            item_id
+            for q_emb, _ in variants
+            for item_id, _ in vector_index.text_index.search(q_emb, limit, **filters)
+        }
+        if image_emb is not None:
+            candidate_ids.update(item_id for item_id, _ in vector_index.image_index.search(image_emb, limit, **filters))
+        candidate_filter = item.id.in_(list(candidate_ids))
+    else:
+        # candidate = nearest neighbour ของแต่ละเวอร์ชัน (HNSW) ∪ แถวที่มีคำตรง (trigram GIN)
+        _set_ef_search(db, limit, filtered=bool(clauses))
+        candidate_sets = [
+            select(item.id)
+            .where(item.text_embedding.isnot(None), *clauses)
+            .order_by(embedding_distance(item.text_embedding, q_emb))
+            .limit(limit)
+            for q_emb, _ in variants
+        ]
+        if image_emb is not None:
+            candidate_sets.append(
+                select(item.id)
+                .where(item.image_embedding.isnot(None), *clauses)
+                .order_by(embedding_distance(item.image_embedding, image_emb))
+                .limit(limit)
+            )
+        all_words = sorted({w for _, words in variants for w in words})
+        if all_words:
+            candidate_sets.append(
+                select(item.id)
+                .where(or_(*[item.search_text.contains(w, autoescape=True) for w in all_words]), *clauses)
+                .limit(limit)
+            )
+        candidates = union(*[select(q.subquery().c.id) for q in candidate_sets]).subquery()
+        candidate_filter = item.id.in_(select(candidates.c.id))
+
+    rows = (
+        db.query(item, score)
+        .options(*_item_options(include_images))
+        .filter(candidate_filter, *clauses)
+        .order_by(score.desc(), item.id)
+        .offset(offset)
+        .limit(top_k)
+        .all()
+    )
+    return [(i, float(sim)) for i, sim in rows]
+
+def rank_results(db: Session, query_texts, query_embs, image_emb, top_k: int, offset: int,
+                 filters: dict, text_weight: float, image_weight: float, include_images: bool = False) -> list:
+    """จัดอันดับด้วย hybrid / nearest แล้วแปลงเป็น dict (sync, รันใน io_pool)
+    ค่าเริ่มต้นส่งแค่ URL ของภาพ include_images=True แนบ base64 ภาพเต็มแบบเดิม"""
+    limit = max((offset + top_k) * 4, SEARCH_CANDIDATES)
+    if query_texts:
+        variants = [(q_emb, q_text.split()) for q_emb, q_text in zip(query_embs, query_texts)]
+        ranked = hybrid_search(
+            db, variants, limit, top_k, offset=offset, filters=filters,
+            image_emb=image_emb, text_weight=text_weight, image_weight=image_weight,
+            include_images=include_images,
+        )
+    else:
+        ranked = nearest_items(db, "image", image_emb, top_k, offset=offset, filters=filters,
+                               include_images=include_images)
+
+    results = []
+    for i, sim in ranked:
+        result = {
+            "id": i.id,
+            "title": i.title,
+            "type": i.type,
+            "category": i.category,
+            "boxed_image_url": boxed_image_url(i),
+            "detections": i.detections,
+            "user_id": i.user_id,
+            "username": i.user.username if i.user else None,
+            "similarity": round(sim, 4),
+            **item_image_urls(i),
+        }
+        if include_images:
+            result.update({
+                "image_data": encode_image(i.original_image_data, i.image_content_type),
+                "boxed_image_data": encode_image(i.boxed_image_data, "image/png"),
+                "original_image_data": encode_image(i.original_image_data, i.image_content_type),
+            })
+        results.append(result)
+    return results
+
 @router.post("/search", response_model=list[schemas.ItemOut])
 async def search_items(
     text: str = Form(None),
     image: UploadFile = File(None),
     db: Session = Depends(get_db),
-    top_k: int = Form(5)
+    top_k: int = Form(5),
+    type: str = Form(None),
+    category: str = Form(None),
+    user_id: int = Form(None),
+    offset: int = Form(0),
+    text_weight: float = Form(SEARCH_TEXT_WEIGHT),
+    image_weight: float = Form(SEARCH_IMAGE_WEIGHT),
+    include_images: bool = Form(False)
 ):
     if not text and not image:
         raise HTTPException(status_code=400, detail="Provide text or image for search")
+    if type and type not in ("lost", "found"):
+        raise HTTPException(status_code=400, detail="type must be 'lost' or 'found'")
+
+    # filter ถูกใส่เป็น WHERE ก่อนคิดคะแนน vector / offset ใช้ขอหน้าถัดไป
+    filters = {"type": type, "category": category, "user_id": user_id}
+    offset = max(offset, 0)
 
-    EPS = 0.15  # small epsilon so we never kill sim to 0 completely when there's no text match
+    # item ที่ process อื่นสร้าง/ลบ: เติม vector_index และเปลี่ยน items_generation ก่อนคิด cache key
+    if crud.items_sync_due():
+        await io_pool.run(crud.sync_items, db)
 
+    image_bytes = await image.read() if image else None
+    # SHA-256 ของภาพ (ใช้ทั้ง key ของ search cache และ image_cache) คำนวณใน io_pool
+    image_key = await image_cache.adigest(image_bytes) if image_bytes else None
+    cache_key = (
+        normalize_text(text) if text else None,
+        image_key,
+        top_k, offset, type, category, user_id,
+        (text_weight, image_weight) if text and image else None,
+        include_images,
+        crud.items_generation,
+    )
+    cached = search_result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    query_texts = query_embs = None
+    degraded = False  # แปลไม่ได้ (timeout / breaker เปิด) ผลนี้ไม่ควรถูก cache
     if text:
         query_texts = [text]
 
         # translate to English if contains Thai
-        if any('\u0E00' <= ch <= '\u0E7F' for ch in text):
-            eng_text = translate_to_english(text)
+        if contains_thai(text):
+            eng_text = await translate_to_english(text, db)
+            degraded = eng_text == text
             query_texts.append(eng_text)
 
         # normalize all query texts
         query_texts = [normalize_text(t) for t in query_texts]
 
-        # get embeddings for all versions via Hugging Face API
-        query_embs = [get_text_embedding(t) for t in query_texts]
-        use_text = True
         print("[INFO] Query texts:", query_texts)
-    else:
-        image_bytes = await image.read()
-        query_embs = [get_image_embedding(image_bytes)]
-        use_text = False
-
-    # fetch candidate items (limit for performance)
-    items = db.query(models.Item).limit(100).all()
-
-    results = []
 
-    for i in items:
-        item_emb = i.text_embedding if use_text else i.image_embedding
-        sims = []
+    # ภาพที่เคยเห็นแล้ว (เช่นรูปเดียวกับ item ใน catalog) ไม่ต้องรัน CLIP ซ้ำ
+    image_emb = await image_cache.aget_embedding(db, image_key) if image_bytes else None
+    if text and image and image_emb is None:
+        # ข้อความ + ภาพ: embed พร้อมกันใน CLIP call เดียว
+        query_embs, image_emb = await inference_pool.run(get_text_image_embeddings, query_texts, image_bytes)
+        await image_cache.aput_embedding(db, image_key, image_emb)
+    elif text:
+        query_embs = list(await asyncio.gather(*[aget_text_embedding(t) for t in query_texts]))
+    elif image_emb is None:
+        image_emb = await aget_image_embedding(image_bytes)
+        await image_cache.aput_embedding(db, image_key, image_emb)
 
-        # compute similarity for all query versions
-        for q_emb, q_text in zip(query_embs, query_texts if use_text else [""]):
-            sim = cosine_similarity(q_emb, item_emb)
-
-            if use_text:
-                combined_text = " ".join(filter(None, [i.title, i.type, i.category]))
-                combined_text = normalize_text(combined_text)
-                query_words = [w for w in q_text.split() if w.strip()]
-                match_factor = sum(1 for w in query_words if w in combined_text) / len(query_words) if query_words else 0.0
-                scale = EPS + (1.0 - EPS) * match_factor
-                sim *= scale
-
-            sims.append(sim)
-
-        sim = max(sims)
-
-        results.append({
-            "id": i.id,
-            "title": i.title,
-            "type": i.type,
-            "category": i.category,
-            "image_data": encode_image(i.original_image_data, i.image_content_type),
-            "boxed_image_data": encode_image(i.boxed_image_data, "image/png"),
-            "original_image_data": encode_image(i.original_image_data, i.image_content_type),
-            "user_id": i.user_id,
-            "username": i.user.username if i.user else None,
-            "similarity": round(sim, 4)
-        })
+    # query DB + สร้างผลลัพธ์ใน io_pool
+    results = await io_pool.run(
+        rank_results, db, query_texts, query_embs, image_emb, top_k,
+        offset, filters, text_weight, image_weight, include_images,
+    )
+    if not degraded:
+        search_result_cache.put(cache_key, results)
+    return results
 
-    # sort and return top_k
-    results = sorted(results, key=lambda x: x["similarity"], reverse=True)
-    return results[:top_k]
+@router.get("/search/stats")
+def search_cache_stats():
+    """hit rate ของ cache ต่างๆ ในเส้นทางค้นหา"""
+    return {
+        "result_cache": search_result_cache.stats(),
+        "text_embedding_cache": utils.text_embedding_cache_info(),
+        "translation_cache": translation.translation_cache.stats(),
+        "image_cache": image_cache.stats(),
+        "inference": utils.inference_stats(),
+        "items_generation": crud.items_generation,
+    }
@@ -61,7 +61,13 @@ class ItemOut(BaseModel):
     type: str
     category: str
     image_data: Optional[str] = None
-    boxed_image_data: Optional[str] = None
+    boxed_image_data: Optional[str] = None  # item เก่าที่เก็บภาพพร้อมกรอบไว้
+    boxed_image_url: Optional[str] = None  # GET ภาพพร้อมกรอบ (render จาก detections)
+    detections: Optional[List[dict]] = None
+    thumbnail_url: Optional[str] = None  # ภาพ crop ย่อ (ใช้ในหน้า list)
+    medium_url: Optional[str] = None  # ภาพต้นฉบับย่อ
+    image_url: Optional[str] = None
+    original_image_url: Optional[str] = None
     image_filename: Optional[str] = None
     user_id: Optional[int] = None
     username: Optional[str] = None
@@ -74,6 +80,16 @@ class ItemOut(BaseModel):
         from_attributes = True
 
 
+class UploadJobOut(BaseModel):
+    job_id: int
+    status: str  # queued / processing / done / failed
+    stage: Optional[str] = None
+    attempts: int = 0
+    queue_position: Optional[int] = None  # จำนวน job ที่รออยู่ก่อนหน้า (เฉพาะ queued)
+    error: Optional[str] = None
+    item: Optional[ItemOut] = None  # มีค่าเมื่อ status = done
+
+
 # -------------------------
 # Message models
 # -------------------------
@@ -0,0 +1,27 @@
+from fastapi import FastAPI, Request
+
+# ======================================================
+# Stub ของ HF translation API สำหรับทดสอบในเครื่อง
+# รัน: uvicorn translate_stub:app --port 8001
+# แล้วตั้ง TRANSLATE_API_URL=http://localhost:8001/translate
+# ======================================================
+app = FastAPI(title="Translation stub")
+
+DICTIONARY = {
+    "กระเป๋าสตางค์": "wallet",
+    "กระเป๋า": "bag",
+    "โทรศัพท์": "phone",
+    "กุญแจ": "key",
+    "บัตรนักศึกษา": "student card",
+    "ร่ม": "umbrella",
+    "นาฬิกา": "watch",
+    "แว่นตา": "glasses",
+}
+
+
+@app.post("/translate")
+async def translate(request: Request):
+    payload = await request.json()
+    text = payload.get("inputs", "")
+    translated = " ".join(DICTIONARY.get(word, word) for word in text.split())
+    return [{"translation_text": translated}]
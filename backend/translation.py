@@ -0,0 +1,150 @@
+import os
+import string
+import time
+import httpx
+from sqlalchemy.orm import Session
+
+import models
+from cache import LRUCache
+from executors import io_pool
+
+# ======================================================
+# แปลไทย -> อังกฤษ (async + timeout + circuit breaker + cache)
+# ======================================================
+HF_TOKEN = os.getenv("HF_TOKEN")
+# ชี้ไปที่ stub ในเครื่องได้ เช่น http://localhost:8001/translate (ดู translate_stub.py)
+TRANSLATE_API_URL = os.getenv(
+    "TRANSLATE_API_URL",
+    "https://router.huggingface.co/hf-inference/models/Helsinki-NLP/opus-mt-th-en",
+)
+TRANSLATE_TIMEOUT = float(os.getenv("TRANSLATE_TIMEOUT", "5"))
+TRANSLATE_FAILURE_THRESHOLD = int(os.getenv("TRANSLATE_FAILURE_THRESHOLD", "3"))
+TRANSLATE_RESET_SECONDS = float(os.getenv("TRANSLATE_RESET_SECONDS", "60"))
+
+# cache ชั้นแรกในหน่วยความจำ ชั้นที่สองคือตาราง translations
+translation_cache = LRUCache(maxsize=int(os.getenv("TRANSLATION_CACHE_SIZE", "4096")))
+
+_client = None
+
+
+def contains_thai(text: str) -> bool:
+    return any('\u0E00' <= ch <= '\u0E7F' for ch in text)
+
+
+class CircuitBreaker:
+    """หยุดเรียก API ชั่วคราวเมื่อพังติดกันหลายครั้ง แล้วค่อยลองใหม่หลังครบเวลา"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(TRANSLATE_FAILURE_THRESHOLD, TRANSLATE_RESET_SECONDS)
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        headers = {"Authorization": f"Bearer {HF_TOKEN}"} if HF_TOKEN else {}
+        _client = httpx.AsyncClient(timeout=TRANSLATE_TIMEOUT, headers=headers)
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _cache_key(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _load_translation(db: Session, key: str):
+    """อ่านจากตาราง translations (sync, รันใน io_pool)"""
+    row = db.query(models.Translation).filter(models.Translation.source_text == key).first()
+    if row:
+        translation_cache.put(key, row.translated_text)
+        return row.translated_text
+    return None
+
+
+def _store_translation(db: Session, key: str, translated: str):
+    """เขียนลงตาราง translations (sync, รันใน io_pool)"""
+    try:
+        db.merge(models.Translation(source_text=key, translated_text=translated))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[⚠️ Warning] Cannot save translation cache: {e}")
+
+
+async def get_cached_translation(db: Session, text: str):
+    """LRU ในหน่วยความจำก่อน miss ค่อยอ่าน DB ใน io_pool"""
+    key = _cache_key(text)
+    translated = translation_cache.get(key)
+    if translated is not None:
+        return translated
+    return await io_pool.run(_load_translation, db, key)
+
+
+async def save_translation(db: Session, text: str, translated: str):
+    key = _cache_key(text)
+    translation_cache.put(key, translated)
+    await io_pool.run(_store_translation, db, key, translated)
+
+
+async def _request_translation(text: str):
+    response = await _get_client().post(TRANSLATE_API_URL, json={"inputs": text})
+    if response.status_code != 200:
+        raise RuntimeError(f"Translation API error: {response.status_code} {response.text}")
+    translated_text = response.json()[0]['translation_text']
+    # ตัด punctuation ที่ปลาย string
+    return translated_text.strip().rstrip(string.punctuation)
+
+
+async def translate_to_english(text: str, db: Session) -> str:
+    """Translate Thai -> English ถ้าแปลไม่ได้ (timeout / breaker เปิด) คืนข้อความเดิม"""
+    if not contains_thai(text):
+        return text
+
+    cached = await get_cached_translation(db, text)
+    if cached is not None:
+        return cached
+
+    if not breaker.allow():
+        return text
+
+    try:
+        translated = await _request_translation(text)
+    except Exception as e:
+        breaker.record_failure()
+        print(f"[⚠️ Warning] Translation failed ({breaker.state}): {e}")
+        return text
+
+    breaker.record_success()
+    await save_translation(db, text, translated)
+    return translated
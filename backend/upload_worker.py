@@ -0,0 +1,361 @@
+import io
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+import crud
+import image_cache
+import matching
+import models
+import schemas
+import utils
+from database import SessionLocal
+from imaging import (
+    THUMBNAIL_SIZE, decode_image, encode_derivative, make_medium, open_image, scale_detections,
+)
+import model_registry
+from model_registry import ModelNotReady, yolo_detect
+
+# ======================================================
+# worker ของคิว upload (ตาราง upload_jobs)
+# ======================================================
+# /api/upload แค่บันทึกภาพต้นฉบับเป็น job แล้วตอบ 202 ทันที
+# worker ดึง job ที่ queued ทีละ batch (SELECT ... FOR UPDATE SKIP LOCKED จึงรันหลาย process ได้)
+# แล้วทำ YOLO + crop ทีละภาพ, CLIP ของทั้ง batch ใน forward pass เดียว, บันทึก item
+# job ที่ค้างใน processing นานเกิน UPLOAD_JOB_TIMEOUT (worker ตาย) จะถูกดึงไปทำใหม่
+# started_at ถูกต่ออายุทุก stage และก่อนบันทึก item จะล็อกแถว job แล้วเช็คว่ายังเป็นของ worker นี้
+# (attempts ไม่เปลี่ยน) job ที่ถูกดึงไปทำซ้ำจึงไม่สร้าง item ซ้ำ
+#
+# รันใน process ของ API (UPLOAD_WORKER_ENABLED=1, ค่าเริ่มต้น) หรือแยก process:
+#     python -m upload_worker
+UPLOAD_WORKER_ENABLED = os.getenv("UPLOAD_WORKER_ENABLED", "1") == "1"
+UPLOAD_BATCH_SIZE = int(os.getenv("UPLOAD_BATCH_SIZE", "16"))
+UPLOAD_POLL_SECONDS = float(os.getenv("UPLOAD_POLL_SECONDS", "2"))
+UPLOAD_JOB_MAX_ATTEMPTS = int(os.getenv("UPLOAD_JOB_MAX_ATTEMPTS", "3"))
+UPLOAD_JOB_TIMEOUT = int(os.getenv("UPLOAD_JOB_TIMEOUT", "300"))  # วินาที
+
+_wake = threading.Event()
+_stop = threading.Event()
+_thread = None
+counters = {"batches": 0, "done": 0, "failed": 0, "retried": 0}
+
+
+# ============================
+# stage 1: YOLO + crop (ทีละภาพ)
+# ============================
+def detect_and_crop(image_bytes: bytes, detections: list = None):
+    """YOLO detect -> crop ตามกรอบ (PNG) + กล่องในระบบพิกัดของภาพ crop
+    ภาพที่วาดกรอบแล้วไม่ได้สร้างตรงนี้ (render ตอนขอดูที่ GET /api/items/{id}/boxed)
+    ถ้าส่ง detections (จาก image_cache) มาจะไม่รัน YOLO ซ้ำ
+    คืน (cropped_image_bytes, crop_detections, detections, (thumbnail, medium))
+    YOLO ใช้ภาพที่ decode แบบย่อ (INGEST_MAX_SIDE) ส่วน medium decode แยกที่ MEDIUM_SIZE (imaging.make_medium)
+    และภาพ crop ที่เก็บลง DB ตัดจากภาพความละเอียดเต็ม ไม่เสียรายละเอียด"""
+    pil_image, scale = decode_image(image_bytes)
+
+    # ตรวจจับวัตถุด้วย YOLO (detections เก็บพิกัดของภาพต้นฉบับ)
+    if detections is None:
+        detections = scale_detections(yolo_detect(pil_image), scale)
+
+    medium = make_medium(image_bytes)
+    if len(detections) == 0:
+        return image_bytes, [], detections, (encode_derivative(pil_image, THUMBNAIL_SIZE), medium)
+
+    # decode เต็มเฉพาะภาพที่มีวัตถุ (max_side=0 = ไม่ย่อ ยังหมุนตาม EXIF เหมือนกัน)
+    full_image = pil_image if scale == 1 else decode_image(image_bytes, max_side=0)[0]
+    width, height = full_image.size
+
+    padding = 5
+    rects = [
+        (
+            max(int(d["x1"]) - padding, 0),
+            max(int(d["y1"]) - padding, 0),
+            min(int(d["x2"]) + padding, width),
+            min(int(d["y2"]) + padding, height),
+        )
+        for d in detections
+    ]
+    rects = [r for r in rects if r[0] < r[2] and r[1] < r[3]]
+    # กรอบที่ครอบทุกกล่อง (กล่องอยู่นอกภาพทั้งหมด = ใช้ทั้งภาพ)
+    crop_box = (
+        (min(r[0] for r in rects), min(r[1] for r in rects), max(r[2] for r in rects), max(r[3] for r in rects))
+        if rects else (0, 0, width, height)
+    )
+    cropped_image = full_image.crop(crop_box)
+
+    cropped_io = io.BytesIO()
+    cropped_image.save(cropped_io, format="PNG")
+    cropped_image_bytes = cropped_io.getvalue()
+
+    # กล่อง + label เทียบกับมุมซ้ายบนของ crop (imaging.draw_detections ใช้วาดทีหลัง)
+    crop_left, crop_upper = crop_box[0], crop_box[1]
+    crop_detections = [
+        {
+            "x1": round(d["x1"] - crop_left, 1),
+            "y1": round(d["y1"] - crop_upper, 1),
+            "x2": round(d["x2"] - crop_left, 1),
+            "y2": round(d["y2"] - crop_upper, 1),
+            "label": d["label"],
+            "confidence": round(float(d["confidence"]), 4),
+        }
+        for d in detections
+    ]
+    return cropped_image_bytes, crop_detections, detections, (encode_derivative(cropped_image, THUMBNAIL_SIZE), medium)
+
+
+# ============================
+# stage 2: CLIP ของทั้ง batch
+# ============================
+def embed_batch(db: Session, jobs: list, cropped: list):
+    """image embedding ของ crop ทุกภาพ + text embedding ของทุก title อย่างละ forward pass เดียว
+    crop ที่เคยเห็นแล้ว (image_cache) ไม่ต้องรัน CLIP ซ้ำ"""
+    image_embs = [image_cache.get_embedding(db, data) for data in cropped]
+    missing = [i for i, emb in enumerate(image_embs) if emb is None]
+    if missing:
+        computed = utils.get_image_embeddings([open_image(cropped[i]) for i in missing])
+        for i, emb in zip(missing, computed):
+            image_embs[i] = emb
+            image_cache.put_embedding(db, cropped[i], emb)
+    text_embs = utils.get_text_embeddings([job.title for job in jobs])
+    return text_embs, image_embs
+
+
+# ============================
+# คิว
+# ============================
+def claim_jobs(db: Session, limit: int) -> list:
+    """จอง job ที่ queued (หรือ processing ที่หมดเวลา) สูงสุด limit งาน"""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=UPLOAD_JOB_TIMEOUT)
+    jobs = (
+        db.query(models.UploadJob)
+        .filter(or_(
+            models.UploadJob.status == "queued",
+            and_(models.UploadJob.status == "processing", models.UploadJob.started_at < stale),
+        ))
+        .order_by(models.UploadJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    claimed = []
+    for job in jobs:
+        if job.item_id is not None:
+            # worker เดิมบันทึก item แล้วแต่ตายก่อนปิดงาน
+            job.image_data = None
+            _finish(job, "done")
+            continue
+        if job.attempts >= UPLOAD_JOB_MAX_ATTEMPTS:
+            _finish(job, "failed", error=job.error or "Upload job timed out")
+            continue
+        job.status, job.stage, job.started_at = "processing", "detect", now
+        job.attempts += 1
+        claimed.append(job)
+    db.commit()
+    return claimed
+
+
+def _finish(job, status: str, error: str = None):
+    job.status, job.stage, job.error = status, None, error
+    job.finished_at = datetime.utcnow()
+    counters[status] += 1
+
+
+def _fail(job, error: Exception):
+    """ลองใหม่ถ้ายังไม่ครบ UPLOAD_JOB_MAX_ATTEMPTS"""
+    print(f"[⚠️ Warning] Upload job {job.id} failed (attempt {job.attempts}): {error}")
+    if job.attempts < UPLOAD_JOB_MAX_ATTEMPTS:
+        job.status, job.stage, job.error = "queued", None, str(error)
+        counters["retried"] += 1
+    else:
+        _finish(job, "failed", error=str(error))
+
+
+def _requeue(db: Session, jobs: list):
+    """โมเดลยังไม่พร้อม: คืน job เข้าคิวโดยไม่นับเป็นความพยายาม"""
+    db.rollback()
+    for job in jobs:
+        if job.status == "processing":
+            job.status, job.stage = "queued", None
+            job.attempts -= 1
+    db.commit()
+
+
+def _set_stage(jobs: list, stage: str):
+    """เปลี่ยน stage + ต่ออายุ started_at (heartbeat) ไม่ให้ถูกมองว่าค้าง"""
+    now = datetime.utcnow()
+    for job in jobs:
+        job.stage, job.started_at = stage, now
+
+
+def _still_owned(db: Session, job, attempt: int) -> bool:
+    """ล็อกแถว job (ถึง commit ถัดไป) แล้วเช็คว่ายังไม่ถูก worker อื่นดึงไปทำ / ทำเสร็จแล้ว"""
+    db.refresh(job, with_for_update=True)
+    return job.status == "processing" and job.attempts == attempt and job.item_id is None
+
+
+def process_batch(db: Session, jobs: list):
+    # attempts ตอนที่ claim ใช้เป็น token ว่า job ยังเป็นของ worker นี้
+    attempts = {job.id: job.attempts for job in jobs}
+
+    # stage 1: YOLO ทีละภาพ (รูปที่เคยตรวจแล้วใช้กล่องจาก image_cache)
+    prepared = []
+    for job in jobs:
+        try:
+            cached_detections = image_cache.get_detections(db, job.image_data)
+            cropped, boxes, detections, derivatives = detect_and_crop(job.image_data, cached_detections)
+            if cached_detections is None:
+                image_cache.put_detections(db, job.image_data, detections)
+            prepared.append((job, cropped, boxes, derivatives))
+        except ModelNotReady:
+            db.commit()  # เก็บผล _fail ของ job ก่อนหน้าไว้ ก่อน _requeue จะ rollback
+            raise
+        except Exception as e:
+            _fail(job, e)
+    _set_stage([p[0] for p in prepared], "embed")
+    db.commit()
+    if not prepared:
+        return
+
+    # stage 2: CLIP ของทั้ง batch
+    try:
+        text_embs, image_embs = embed_batch(db, [p[0] for p in prepared], [p[1] for p in prepared])
+    except ModelNotReady:
+        raise
+    except Exception as e:
+        # ทั้ง batch ล้ม: รันแยกทีละ job ให้ _fail ตกแค่ job ที่เสียจริง (job อื่นไม่เสีย attempt)
+        db.rollback()
+        print(f"[upload_worker] embed batch failed ({e}), retrying jobs one by one")
+        embedded, text_embs, image_embs = [], [], []
+        for p in prepared:
+            try:
+                (text_emb,), (image_emb,) = embed_batch(db, [p[0]], [p[1]])
+            except ModelNotReady:
+                raise
+            except Exception as job_error:
+                db.rollback()
+                _fail(p[0], job_error)
+                continue
+            embedded.append(p)
+            text_embs.append(text_emb)
+            image_embs.append(image_emb)
+        db.commit()
+        prepared = embedded
+
+    # stage 3: บันทึก item + จับคู่
+    for (job, cropped, boxes, (thumbnail, medium)), text_emb, image_emb in zip(prepared, text_embs, image_embs):
+        try:
+            if not _still_owned(db, job, attempts[job.id]):
+                print(f"[upload_worker] job {job.id} was reclaimed by another worker, skipping save")
+                db.commit()
+                continue
+            _set_stage([job], "save")
+            item = crud.create_item(
+                db=db,
+                item=schemas.ItemCreate(title=job.title, type=job.type, category=job.category),
+                image_bytes=cropped,
+                image_filename=job.image_filename,
+                image_content_type=job.image_content_type,
+                user_id=job.user_id,
+                detections=boxes,
+                original_image_data=job.image_data,
+                thumbnail_data=thumbnail,
+                medium_data=medium,
+                image_emb=utils.check_image_embedding(image_emb),
+                text_emb=text_emb.tolist(),
+            )
+        except Exception as e:
+            db.rollback()
+            _fail(job, e)
+            db.commit()
+            continue
+        job.item_id = item.id  # บันทึกทันที ถ้า worker ตายระหว่างจับคู่ job นี้จะไม่สร้าง item ซ้ำ
+        db.commit()
+
+        # จับคู่กับ item ฝั่งตรงข้าม (lost <-> found) เก็บไว้ให้ดูผ่าน /items/{id}/matches
+        try:
+            # worker ที่รันแยก process ไม่ได้โหลด index ตอน startup: sync ครั้งแรกดึงทั้งหมด
+            crud.sync_items(db)
+            matching.refresh_matches(db, item)
+        except Exception as e:
+            db.rollback()
+            print(f"[⚠️ Warning] Match stage failed for item {item.id}: {e}")
+
+        job.image_data = None  # item เก็บภาพต้นฉบับไว้แล้ว
+        _finish(job, "done")
+        db.commit()
+
+
+def run_once(batch_size: int = UPLOAD_BATCH_SIZE) -> int:
+    """ทำหนึ่ง batch คืนจำนวน job ที่ดึงมา (0 = คิวว่าง)"""
+    db = SessionLocal()
+    try:
+        jobs = claim_jobs(db, batch_size)
+        if not jobs:
+            return 0
+        try:
+            process_batch(db, jobs)
+        except ModelNotReady:
+            _requeue(db, jobs)
+            raise
+        counters["batches"] += 1
+        return len(jobs)
+    finally:
+        db.close()
+
+
+# ============================
+# thread ของ worker
+# ============================
+def wake():
+    """ปลุก worker ทันทีที่มี job ใหม่ (ไม่ต้องรอรอบ poll)"""
+    _wake.set()
+
+
+def _run():
+    while not _stop.is_set():
+        try:
+            claimed = run_once()
+        except ModelNotReady as e:
+            print(f"[upload_worker] {e}, retrying in 5s")
+            _stop.wait(5)
+            continue
+        except Exception as e:
+            print(f"[⚠️ Warning] Upload worker error: {e}")
+            claimed = 0
+        if claimed < UPLOAD_BATCH_SIZE:
+            # คิวหมดแล้ว รอ job ใหม่ (ถ้าได้เต็ม batch ให้ดึงต่อทันที)
+            _wake.wait(UPLOAD_POLL_SECONDS)
+            _wake.clear()
+
+
+def start():
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="upload-worker", daemon=True)
+    _thread.start()
+    print(f"✅ Upload worker started (batch {UPLOAD_BATCH_SIZE})")
+
+
+def stop():
+    _stop.set()
+    _wake.set()
+
+
+def stats() -> dict:
+    return {"running": _thread is not None and _thread.is_alive(), "batch_size": UPLOAD_BATCH_SIZE, **counters}
+
+
+if __name__ == "__main__":
+    # โหลดโมเดลเบื้องหลัง (ลองใหม่เองถ้า hub ล่ม) ระหว่างนั้น job จะถูกคืนเข้าคิว
+    model_registry.start_background_loading()
+    start()
+    try:
+        while _thread.is_alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop()
@@ -1,49 +1,79 @@
 import torch  # นำเข้า PyTorch สำหรับประมวลผล tensor และโมเดล
 from PIL import Image  # นำเข้า PIL สำหรับเปิดและจัดการภาพ
-from transformers import CLIPProcessor, CLIPModel  # นำเข้า CLIP processor และ model จาก Hugging Face
-import io  # นำเข้า io สำหรับจัดการ stream ของไฟล์
 import numpy as np  # นำเข้า NumPy สำหรับการคำนวณทางคณิตศาสตร์
 import os
-
-device = "cuda" if torch.cuda.is_available() else "cpu"  # ตรวจสอบ device
+from cache import LRUCache
+from executors import inference_pool
+from inference import BatchScheduler
+from imaging import open_image
+from model_registry import clip, clip_inputs, to_numpy, CLIP_REPO, EMBEDDING_MODEL_VERSION
 
 # ======================================================
-# โหลด fine-tuned CLIP จาก Hugging Face (private repo)
+# fine-tuned CLIP มาจาก model_registry (โหลดครั้งเดียวต่อ process)
 # ======================================================
-HF_TOKEN = os.getenv("HF_TOKEN")  # สำหรับ private repo
-finetuned_repo = "freemanlnwza/modelCLIPfine-tuned"
-
-try:
-    print("✅ Loading fine-tuned CLIP from Hugging Face...")
-    finetuned_processor = CLIPProcessor.from_pretrained(
-        finetuned_repo,
-        token=HF_TOKEN  # v5 Transformers ใช้ token แทน use_auth_token
-    )
-    finetuned_model = CLIPModel.from_pretrained(
-        finetuned_repo,
-        token=HF_TOKEN  # v5 Transformers ใช้ token แทน use_auth_token
-    ).to(device)
-    use_finetuned = True
-    print("✅ Fine-tuned CLIP loaded from HF.")
-except Exception as e:
-    print(f"[⚠️ Warning] Failed to load fine-tuned CLIP: {e}")
-    finetuned_processor = None
-    finetuned_model = None
-    use_finetuned = False
+finetuned_repo = CLIP_REPO
 
 # ======================================================
 # ฟังก์ชัน embedding
 # ======================================================
-def get_text_embedding(text):
-    """รับข้อความแล้วคืนค่า embedding เป็น numpy array"""
-    processor = finetuned_processor
-    model = finetuned_model
+# cache embedding ของข้อความ key = (EMBEDDING_MODEL_VERSION, ข้อความที่ normalise แล้ว)
+# ใช้ version ไม่ใช่แค่ชื่อ repo เปลี่ยน CLIP_REVISION แล้ว key เก่าจะไม่ถูกใช้
+TEXT_EMBEDDING_CACHE_SIZE = int(os.getenv("TEXT_EMBEDDING_CACHE_SIZE", "2048"))
+text_embedding_cache = LRUCache(maxsize=TEXT_EMBEDDING_CACHE_SIZE)
+
+def _normalize_query_text(text: str) -> str:
+    # CLIP tokenizer แปลงเป็นตัวพิมพ์เล็กและตัดช่องว่างเองอยู่แล้ว key จึงใช้รูปเดียวกัน
+    return " ".join(str(text).lower().split())
 
-    inputs = processor(text=[text], return_tensors="pt", padding=True)
+def l2_normalize(embeddings) -> np.ndarray:
+    """normalise ให้ norm = 1 (รับทั้ง vector เดียวหรือ matrix ทีละแถว)
+    ทุก embedding ในระบบเป็น unit vector ความคล้ายจึงเป็นแค่ inner product"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.where(norms > 0, norms, 1.0)
+
+def get_text_embeddings(texts):
+    """embedding ของข้อความหลายรายการใน forward pass เดียว (ไม่ผ่าน cache)"""
+    model, processor = clip.get()
+
+    inputs = clip_inputs(processor, text=list(texts), padding=True)
     with torch.no_grad():
-        embeddings = model.get_text_features(**inputs)
-        print(f"[INFO] Embedding shape: {embeddings.shape}")
-    return embeddings[0].numpy()
+        embeddings = model.get_text_features(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"])
+    return list(l2_normalize(to_numpy(embeddings)))
+
+def get_image_embeddings(images):
+    """embedding ของภาพหลายภาพ (PIL.Image) ใน forward pass เดียว"""
+    model, processor = clip.get()
+
+    inputs = clip_inputs(processor, images=list(images))
+    with torch.no_grad():
+        embeddings = model.get_image_features(pixel_values=inputs["pixel_values"])
+    return list(l2_normalize(to_numpy(embeddings)))
+
+# รวม request ที่เข้ามาพร้อมกันจากหลาย handler เป็น batch เดียว (ดู inference.py)
+text_batcher = BatchScheduler("clip-text", get_text_embeddings)
+image_batcher = BatchScheduler("clip-image", get_image_embeddings)
+
+def get_text_embedding(text):
+    """รับข้อความแล้วคืนค่า embedding เป็น numpy array (ผ่าน LRU cache)"""
+    key = (EMBEDDING_MODEL_VERSION, _normalize_query_text(text))
+    cached = text_embedding_cache.get(key)
+    if cached is None:
+        cached = text_batcher.submit(key[1]).result()
+        text_embedding_cache.put(key, cached)
+    return cached.copy()
+
+async def aget_text_embedding(text):
+    """เหมือน get_text_embedding แต่ await ผลจาก batch scheduler แทนการ block event loop"""
+    key = (EMBEDDING_MODEL_VERSION, _normalize_query_text(text))
+    cached = text_embedding_cache.get(key)
+    if cached is None:
+        cached = await text_batcher.asubmit(key[1])
+        text_embedding_cache.put(key, cached)
+    return cached.copy()
+
+def text_embedding_cache_info() -> dict:
+    return text_embedding_cache.stats()
 
 def get_image_embedding(image_source):
     """
@@ -51,32 +81,61 @@ def get_image_embedding(image_source):
       - path
       - UploadFile (FastAPI)
       - bytes หรือ io.BytesIO
+      - PIL.Image
     คืนค่า embedding เป็น numpy array
     """
-    processor = finetuned_processor
-    model = finetuned_model
+    return image_batcher.submit(_open_image(image_source)).result()
+
+async def aget_image_embedding(image_source):
+    """เหมือน get_image_embedding แต่ decode ภาพใน inference_pool (ไม่ทำ PIL บน event loop)"""
+    if not isinstance(image_source, Image.Image):
+        image_source = await inference_pool.run(_open_image, image_source)
+    return await image_batcher.asubmit(_open_image(image_source))
 
+def inference_stats() -> dict:
+    return {"clip_text": text_batcher.stats(), "clip_image": image_batcher.stats()}
+
+def _open_image(image_source):
+    if isinstance(image_source, Image.Image):
+        return image_source if image_source.mode == "RGB" else image_source.convert("RGB")
     if hasattr(image_source, "file"):  # UploadFile
         image_bytes = image_source.file.read()
         image_source.file.seek(0)
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    elif isinstance(image_source, (bytes, io.BytesIO)):
-        if isinstance(image_source, bytes):
-            image_source = io.BytesIO(image_source)
-        image = Image.open(image_source).convert("RGB")
-    else:  # path
-        image = Image.open(image_source).convert("RGB")
-
-    inputs = processor(images=image, return_tensors="pt")
+        return open_image(image_bytes)
+    return open_image(image_source)  # bytes / io.BytesIO / path (ย่อ + หมุนตาม EXIF ดู imaging.py)
+
+def get_text_image_embeddings(texts, image_source):
+    """embedding ของข้อความหลายเวอร์ชัน + ภาพ 1 ภาพ ใน CLIP forward pass เดียว
+    คืนค่า (list ของ text embedding, image embedding)
+    ถ้าข้อความทุกอันอยู่ใน cache แล้วจะรันเฉพาะฝั่งภาพ"""
+    keys = [(EMBEDDING_MODEL_VERSION, _normalize_query_text(t)) for t in texts]
+    cached = [text_embedding_cache.get(key) for key in keys]
+    if all(c is not None for c in cached):
+        return [c.copy() for c in cached], get_image_embedding(image_source)
+
+    model, processor = clip.get()
+
+    image = _open_image(image_source)
+    inputs = clip_inputs(processor, text=[key[1] for key in keys], images=image, padding=True)
     with torch.no_grad():
-        embeddings = model.get_image_features(**inputs)
-    return embeddings[0].numpy()
+        text_features = model.get_text_features(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"])
+        image_features = model.get_image_features(pixel_values=inputs["pixel_values"])
+
+    text_embs = list(l2_normalize(to_numpy(text_features)))
+    for key, emb in zip(keys, text_embs):
+        text_embedding_cache.put(key, emb)
+    return [emb.copy() for emb in text_embs], l2_normalize(to_numpy(image_features))[0]
 
 # ===========================
 # ฟังก์ชันตรวจสอบ embedding
 # ===========================
 def validate_image_embedding(image_bytes: bytes) -> list:
-    embedding = get_image_embedding(image_bytes)
+    return check_image_embedding(get_image_embedding(image_bytes))
+
+async def avalidate_image_embedding(image_bytes: bytes) -> list:
+    return check_image_embedding(await aget_image_embedding(image_bytes))
+
+def check_image_embedding(embedding) -> list:
     if embedding is None:
         raise ValueError("Image embedding is None")
 
@@ -91,6 +150,6 @@ def validate_image_embedding(image_bytes: bytes) -> list:
 # ฟังก์ชัน cosine similarity
 # ===========================
 def cosine_similarity(vec1: np.ndarray, vec2: np.ndarray) -> float:
-    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+    # embedding จาก get_*_embedding(s) normalise แล้ว ไม่ต้องหาร norm ซ้ำ
+    return float(np.dot(vec1, vec2))
 
-print("[DEBUG] utils.py loaded and ready (fine-tuned connected)" if use_finetuned else "[DEBUG] utils.py loaded (base only)")
@@ -0,0 +1,200 @@
+import os
+import threading
+import numpy as np
+
+# ======================================================
+# In-memory embedding index (ทางเลือกแทน pgvector)
+# ======================================================
+# SEARCH_ENGINE=memory -> ค้นหาจาก matrix ใน process แทนการ query ผ่าน HNSW
+# หมายเหตุ: แต่ละ worker มี index ของตัวเอง ผลค้นหาจะถูก join กับตาราง items
+# อีกครั้งเสมอ item ที่ถูกลบจาก worker อื่นจึงไม่หลุดออกไปถึง client
+# item ที่ process อื่นสร้าง (upload worker แยก process / uvicorn หลาย worker) ถูกดึงเพิ่ม
+# ด้วย load_new (id > max_loaded_id) ผ่าน crud.sync_items
+SEARCH_ENGINE = os.getenv("SEARCH_ENGINE", "pgvector").lower()
+ENABLED = SEARCH_ENGINE == "memory"
+
+EMBEDDING_DIM = 512
+
+
+def _normalize(vec) -> np.ndarray:
+    if hasattr(vec, "to_numpy"):  # pgvector HalfVector (EMBEDDING_STORAGE=halfvec)
+        vec = vec.to_numpy()
+    vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+
+class EmbeddingIndex:
+    """เก็บ embedding ที่ L2-normalised แล้วเป็น float32 matrix + map id -> row
+    ค้นหาด้วย matrix-vector product ครั้งเดียวแล้วใช้ argpartition หา top-k"""
+
+    def __init__(self, dim: int = EMBEDDING_DIM, capacity: int = 1024):
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        # metadata สำหรับ filter ก่อนคิดคะแนน
+        self._types = np.empty(capacity, dtype=object)
+        self._categories = np.empty(capacity, dtype=object)
+        self._user_ids = np.zeros(capacity, dtype=np.int64)
+        self._row_of = {}  # item_id -> row
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self, needed: int):
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        matrix = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+        for name in ("_ids", "_types", "_categories", "_user_ids"):
+            old = getattr(self, name)
+            new = np.empty(new_capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def clear(self):
+        with self._lock:
+            self._row_of.clear()
+            self._size = 0
+
+    def add(self, item_id: int, embedding, type: str = None, category: str = None, user_id: int = 0):
+        """เพิ่มหรือแทนที่ embedding ของ item"""
+        if embedding is None:
+            return
+        vec = _normalize(embedding)
+        with self._lock:
+            row = self._row_of.get(item_id)
+            if row is None:
+                self._grow(self._size + 1)
+                row = self._size
+                self._size += 1
+                self._row_of[item_id] = row
+                self._ids[row] = item_id
+            self._matrix[row] = vec
+            self._types[row] = type
+            self._categories[row] = category
+            self._user_ids[row] = user_id or 0
+
+    def remove(self, item_id: int):
+        """ลบ item โดยย้ายแถวสุดท้ายมาแทนที่ (O(1))"""
+        with self._lock:
+            row = self._row_of.pop(item_id, None)
+            if row is None:
+                return
+            last = self._size - 1
+            if row != last:
+                moved_id = int(self._ids[last])
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved_id
+                self._types[row] = self._types[last]
+                self._categories[row] = self._categories[last]
+                self._user_ids[row] = self._user_ids[last]
+                self._row_of[moved_id] = row
+            self._size = last
+
+    def search(self, query, k: int, type: str = None, category: str = None, user_id: int = None):
+        """คืน list ของ (item_id, cosine similarity) เรียงจากมากไปน้อย
+        filter จะตัดแถวออกก่อนคูณ matrix จึงคิดคะแนนเฉพาะ item ที่ผ่านเงื่อนไข"""
+        q = _normalize(query)
+        with self._lock:
+            n = self._size
+            if n == 0 or k <= 0:
+                return []
+            mask = None
+            if type:
+                mask = self._types[:n] == type
+            if category:
+                mask = (self._categories[:n] == category) if mask is None else mask & (self._categories[:n] == category)
+            if user_id is not None:
+                mask = (self._user_ids[:n] == user_id) if mask is None else mask & (self._user_ids[:n] == user_id)
+
+            if mask is None:
+                scores = self._matrix[:n] @ q
+                ids = self._ids[:n].copy()
+            else:
+                rows = np.flatnonzero(mask)
+                if len(rows) == 0:
+                    return []
+                scores = self._matrix[rows] @ q
+                ids = self._ids[rows]
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[r]), float(scores[r])) for r in top]
+
+
+text_index = EmbeddingIndex()
+image_index = EmbeddingIndex()
+max_loaded_id = 0  # id สูงสุดที่ดึงจาก DB แล้ว
+# transaction ที่ได้ id ก่อนอาจ commit ทีหลัง load_new จึงอ่านย้อนกลับไปอีกช่วงหนึ่ง (add ซ้ำ = แทนที่)
+SYNC_LOOKBACK_IDS = int(os.getenv("VECTOR_INDEX_SYNC_LOOKBACK", "100"))
+_load_lock = threading.Lock()
+
+
+def get_index(kind: str) -> EmbeddingIndex:
+    return text_index if kind == "text" else image_index
+
+
+# ======================================================
+# ซิงค์กับฐานข้อมูล
+# ======================================================
+def _load_rows(db, after_id: int, batch_size: int) -> int:
+    global max_loaded_id
+    import models
+
+    item = models.Item
+    rows = (
+        db.query(item.id, item.text_embedding, item.image_embedding, item.type, item.category, item.user_id)
+        .filter(item.id > after_id)
+        .execution_options(yield_per=batch_size)
+    )
+    loaded = 0
+    for item_id, text_emb, image_emb, type_, category, user_id in rows:
+        text_index.add(item_id, text_emb, type_, category, user_id)
+        image_index.add(item_id, image_emb, type_, category, user_id)
+        max_loaded_id = max(max_loaded_id, item_id)
+        loaded += 1
+    return loaded
+
+
+def load_from_db(db, batch_size: int = 1000):
+    """โหลด embedding ของทุก item เข้าหน่วยความจำ (เรียกครั้งเดียวตอน startup)"""
+    global max_loaded_id
+    with _load_lock:
+        text_index.clear()
+        image_index.clear()
+        max_loaded_id = 0
+        _load_rows(db, 0, batch_size)
+    print(f"✅ Embedding index loaded: {len(text_index)} text / {len(image_index)} image vectors")
+
+
+def load_new(db, batch_size: int = 1000) -> int:
+    """เพิ่ม item ที่ id > max_loaded_id (สร้างจาก process อื่น) คืนจำนวนที่เพิ่ม"""
+    if not ENABLED:
+        return 0
+    with _load_lock:
+        before = len(text_index)
+        _load_rows(db, max(max_loaded_id - SYNC_LOOKBACK_IDS, 0), batch_size)
+        return len(text_index) - before
+
+
+def add_item(item):
+    # ไม่ขยับ max_loaded_id: item ของ process อื่นที่ id ต่ำกว่ายังต้องถูกดึงด้วย load_new
+    if not ENABLED:
+        return
+    text_index.add(item.id, item.text_embedding, item.type, item.category, item.user_id)
+    image_index.add(item.id, item.image_embedding, item.type, item.category, item.user_id)
+
+
+def remove_items(item_ids):
+    if not ENABLED:
+        return
+    for item_id in item_ids:
+        text_index.remove(item_id)
+        image_index.remove(item_id)
@@ -448,9 +448,10 @@ const AdminPage = () => {
             <tr key={i.id} className="border-b border-black/40 hover:bg-blue-600/30">
               <td className="text-black font-medium py-4 px-4">{i.id}</td>
               <td className="py-4 px-4">
-                {i.image ? (
+                {i.thumbnail_url ? (
                   <img
-                    src={`data:image/jpeg;base64,${i.image}`}
+                    src={`${API_URL}${i.thumbnail_url}`}
+                    loading="lazy"
                     alt={i.title}
                     className="w-16 h-16 object-cover rounded-lg border border-black/40"
                   />
@@ -23,6 +23,8 @@ const CameraPage = () => {
   const canvasRef = useRef(null);
   const detectionIntervalRef = useRef(null);
   const autoStopTimerRef = useRef(null);
+  const socketRef = useRef(null);
+  const httpPendingRef = useRef(false);
   const navigate = useNavigate();
 
   const [facingMode, setFacingMode] = useState("environment");
@@ -34,6 +36,58 @@ const CameraPage = () => {
     if (stream) stream.getTracks().forEach((t) => t.stop());
     if (detectionIntervalRef.current) clearInterval(detectionIntervalRef.current);
     if (autoStopTimerRef.current) clearTimeout(autoStopTimerRef.current);
+    if (socketRef.current) {
+      socketRef.current.onclose = null;
+      socketRef.current.close();
+      socketRef.current = null;
+    }
+  };
+
+  // ✅ วาดกรอบ detection ลง canvas (ใช้ทั้ง WebSocket และ HTTP fallback)
+  const drawDetections = (detections) => {
+    if (!videoRef.current || !canvasRef.current || !detections) return;
+    const width = videoRef.current.videoWidth;
+    const height = videoRef.current.videoHeight;
+    canvasRef.current.width = width;
+    canvasRef.current.height = height;
+    const ctx = canvasRef.current.getContext("2d");
+    ctx.clearRect(0, 0, width, height);
+
+    detections.forEach((det) => {
+      ctx.strokeStyle = det.label === "person" ? "red" : "lime";
+      ctx.lineWidth = 3;
+      ctx.strokeRect(det.x1, det.y1, det.x2 - det.x1, det.y2 - det.y1);
+
+      ctx.fillStyle = "rgba(0,0,0,0.6)";
+      ctx.fillRect(det.x1, det.y1 - 20, 120, 20);
+      ctx.fillStyle = "white";
+      ctx.font = "14px Arial";
+      ctx.fillText(
+        `${det.label} ${(det.confidence * 100).toFixed(1)}%`,
+        det.x1 + 5,
+        det.y1 - 5
+      );
+    });
+  };
+
+  // ✅ WebSocket /detect/stream: login ครั้งเดียวตอนเชื่อมต่อ แล้วส่ง frame เป็น binary
+  const openSocket = () => {
+    if (socketRef.current) socketRef.current.close();
+    const ws = new WebSocket(`${API_URL.replace(/^http/, "ws")}/detect/stream`);
+    ws.binaryType = "arraybuffer";
+    ws.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.error) {
+        console.warn("Detection error:", data.error);
+        return;
+      }
+      drawDetections(data.detections);
+    };
+    ws.onclose = () => {
+      // ปิดไปแล้ว interval จะ fallback เป็น HTTP เอง
+      if (socketRef.current === ws) socketRef.current = null;
+    };
+    socketRef.current = ws;
   };
 
   const startCamera = async () => {
@@ -51,18 +105,20 @@ const CameraPage = () => {
 
       // Clear previous detection interval
       if (detectionIntervalRef.current) clearInterval(detectionIntervalRef.current);
+      openSocket();
 
       // Start detection interval
-      detectionIntervalRef.current = setInterval(async () => {
+      detectionIntervalRef.current = setInterval(() => {
         if (!videoRef.current || !canvasRef.current) return;
         const width = videoRef.current.videoWidth;
         const height = videoRef.current.videoHeight;
         if (!width || !height) return;
 
-        canvasRef.current.width = width;
-        canvasRef.current.height = height;
-        const ctx = canvasRef.current.getContext("2d");
-        ctx.clearRect(0, 0, width, height);
+        const ws = socketRef.current;
+        const streaming = ws && ws.readyState === WebSocket.OPEN;
+        // ✅ ส่ง frame ใหม่เมื่อ frame ก่อนหน้าออกจาก buffer แล้ว (server เก็บเฉพาะ frame ล่าสุด)
+        if (streaming && ws.bufferedAmount > 0) return;
+        if (!streaming && httpPendingRef.current) return;
 
         const tmpCanvas = document.createElement("canvas");
         tmpCanvas.width = width;
@@ -71,9 +127,15 @@ const CameraPage = () => {
 
         tmpCanvas.toBlob(async (blob) => {
           if (!blob) return;
+          if (streaming) {
+            ws.send(blob);
+            return;
+          }
+
+          // fallback: WebSocket ต่อไม่ได้ ใช้ POST /detect/frame แบบเดิม
           const formData = new FormData();
           formData.append("image", blob, "frame.jpg");
-
+          httpPendingRef.current = true;
           try {
             const res = await fetch(`${API_URL}/detect/frame`, {
               method: "POST",
@@ -84,28 +146,14 @@ const CameraPage = () => {
             if (!res.ok) return;
 
             const data = await res.json();
-            if (data.detections) {
-              data.detections.forEach((det) => {
-                ctx.strokeStyle = det.label === "person" ? "red" : "lime";
-                ctx.lineWidth = 3;
-                ctx.strokeRect(det.x1, det.y1, det.x2 - det.x1, det.y2 - det.y1);
-
-                ctx.fillStyle = "rgba(0,0,0,0.6)";
-                ctx.fillRect(det.x1, det.y1 - 20, 120, 20);
-                ctx.fillStyle = "white";
-                ctx.font = "14px Arial";
-                ctx.fillText(
-                  `${det.label} ${(det.confidence * 100).toFixed(1)}%`,
-                  det.x1 + 5,
-                  det.y1 - 5
-                );
-              });
-            }
+            drawDetections(data.detections);
           } catch (err) {
             console.error("Detection error:", err);
+          } finally {
+            httpPendingRef.current = false;
           }
-        });
-      }, 800);
+        }, "image/jpeg", 0.8);
+      }, 250);
 
       // ✅ Auto-stop camera after 1 minute (60,000 ms)
       autoStopTimerRef.current = setTimeout(() => {
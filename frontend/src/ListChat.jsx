@@ -214,9 +214,10 @@ const submitReport = async () => {
             key={item.id}
             className="bg-gray-800 rounded-xl p-3 hover:bg-gray-700 cursor-pointer transition flex flex-col"
           >
-            {item.image_data ? (
+            {item.thumbnail_url ? (
               <img
-                src={item.image_data}
+                src={`${API_URL}${item.thumbnail_url}`}
+                loading="lazy"
                 alt={item.title}
                 className="w-full h-32 object-cover rounded-lg"
               />
@@ -290,9 +291,10 @@ const submitReport = async () => {
               key={chat.chat_id}
               className="flex items-center gap-3 p-4 hover:bg-gray-800 cursor-pointer transition-colors duration-200"
             >
-              {chat.item_image ? (
+              {chat.item_thumbnail_url ? (
                 <img
-                  src={chat.item_image}
+                  src={`${API_URL}${chat.item_thumbnail_url}`}
+                  loading="lazy"
                   alt="item"
                   className="w-12 h-12 object-cover rounded-lg"
                 />
@@ -309,7 +311,7 @@ const submitReport = async () => {
       state: {
         otherUserId: partner.id,
         ownerUsername: partner.username,
-        itemImage: chat.item_image || null,
+        itemImage: chat.item_thumbnail_url ? `${API_URL}${chat.item_thumbnail_url}` : null,
         itemTitle: chat.item_title || null,
       },
     })
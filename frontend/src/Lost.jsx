@@ -237,7 +237,8 @@ const Lost = ({ currentUserId }) => {
                 >
                   <div className="relative w-full h-48 overflow-hidden rounded-t-3xl bg-gray-800">
                     <img
-                      src={showActualImage ? item.original_image_data : item.image_data}
+                      src={`${API_URL}${showActualImage ? item.medium_url : item.thumbnail_url}`}
+                      loading="lazy"
                       alt={item.title}
                       className={
                         showActualImage
@@ -306,7 +307,7 @@ const Lost = ({ currentUserId }) => {
                     {currentUserId && (
                       <button
                         onClick={() =>
-                          handleChat(item.user_id, item.id, item.username, item.image_data, item.title)
+                          handleChat(item.user_id, item.id, item.username, `${API_URL}${item.thumbnail_url}`, item.title)
                         }
                         className="w-full py-1.5 rounded-lg font-semibold text-white bg-gradient-to-r from-green-500 to-emerald-600 hover:from-green-600 hover:to-emerald-700 transition-all text-sm flex items-center justify-center"
                       >
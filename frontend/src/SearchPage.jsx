@@ -80,14 +80,13 @@ const SearchPage = () => {
                 )}
 
                 {/* Image */}
-                {(item.original_image_data || item.boxed_image_data) && (
+                {(item.medium_url || item.thumbnail_url) && (
                   <div className="mt-3 w-full aspect-square relative overflow-hidden rounded-lg bg-gray-900">
                     <img
                       src={
-                        showActualImage
-                          ? item.original_image_data || item.boxed_image_data
-                          : item.original_image_data || item.boxed_image_data
+                        `${API_URL}${showActualImage ? item.medium_url : item.thumbnail_url}`
                       }
+                      loading="lazy"
                       alt={item.title || "Image"}
                       className={
                         showActualImage
@@ -3,6 +3,10 @@ import { useNavigate, useLocation } from "react-router-dom";
 import { CheckCircle, XCircle, AlertCircle } from "lucide-react";
 import { API_URL } from "./configurl"; 
 
+// poll สถานะงาน upload ทุก 1 วินาที ไม่เกิน 3 นาที (worker ไม่ทำงาน = ไม่หมุนค้างตลอดไป)
+const UPLOAD_POLL_INTERVAL_MS = 1000;
+const UPLOAD_POLL_MAX_ATTEMPTS = 180;
+
 // ===================== Popup Component =====================
 const Popup = ({ type = "success", message, onClose, uploadedItem }) => {
   return (
@@ -68,10 +72,10 @@ const Popup = ({ type = "success", message, onClose, uploadedItem }) => {
                   </div>
 
                   {/* Right side: Image */}
-                  {item.boxed_image_data && (
+                  {(item.boxed_image_data || item.boxed_image_url) && (
                     <div className="w-full sm:w-[60%] flex justify-center items-center p-4">
                       <img
-                        src={item.boxed_image_data}
+                        src={item.boxed_image_data || `${API_URL}${item.boxed_image_url}`}
                         alt="Detected result"
                         className="w-full h-80 sm:h-96 object-contain bg-gray-900 rounded-xl"
                       />
@@ -125,6 +129,7 @@ const UploadPage = () => {
 
   const [showConfirmPopup, setShowConfirmPopup] = useState(false);
   const [isSubmitting, setIsSubmitting] = useState(false); // ✅ Lock ปุ่ม
+  const [uploadStatus, setUploadStatus] = useState(""); // สถานะ job ระหว่างรอ worker
   const [cooldown, setCooldown] = useState(false);
   const [cooldownTime, setCooldownTime] = useState(0);
   const [showCooldownPopup, setShowCooldownPopup] = useState(false);
@@ -207,6 +212,30 @@ const UploadPage = () => {
     navigate(location.pathname, { replace: true, state: {} });
   };
 
+  // ===================== Poll upload job =====================
+  const waitForUploadJob = async (jobId) => {
+    for (let attempt = 0; attempt < UPLOAD_POLL_MAX_ATTEMPTS; attempt++) {
+      const res = await fetch(`${API_URL}/api/upload/${jobId}`, {
+        credentials: "include",
+      });
+      if (!res.ok) throw new Error("Upload status failed");
+
+      const job = await res.json();
+      if (job.status === "done") return job;
+      if (job.status === "failed") throw new Error(job.error || "Upload failed");
+      setUploadStatus(
+        job.status === "queued"
+          ? `Waiting in queue${job.queue_position ? ` (${job.queue_position} ahead)` : ""}...`
+          : `Processing (${job.stage || "detect"})...`
+      );
+      await new Promise((resolve) => setTimeout(resolve, UPLOAD_POLL_INTERVAL_MS));
+    }
+    const timeout = new Error("Upload status timed out");
+    timeout.userMessage =
+      "Your upload is still waiting to be processed. Please check your items again in a few minutes.";
+    throw timeout;
+  };
+
   // ===================== Submit Form =====================
   
 const submitForm = async () => {
@@ -226,6 +255,7 @@ const submitForm = async () => {
   }
 
   setIsSubmitting(true);
+  setUploadStatus("Uploading...");
 
   const formData = new FormData();
   formData.append("image", uploadedImage);
@@ -244,20 +274,23 @@ const submitForm = async () => {
 
     if (!res.ok) throw new Error("Upload failed");
 
-    const data = await res.json();
-    setUploadedItem(data);
+    // ✅ server ตอบ 202 + job id ทันที แล้วประมวลผล (YOLO / CLIP) เบื้องหลัง
+    const job = await res.json();
+    const data = await waitForUploadJob(job.job_id);
+    setUploadedItem(data.item);
     setPopupType("success");
     setShowPopup(true);
 
     // ✅ เริ่มคูลดาวน์ 1 นาที (60 วินาที)
     setCooldown(true);
     setCooldownTime(60);
-  } catch {
-    setPopupMessage("Upload failed, please try again.");
+  } catch (err) {
+    setPopupMessage(err.userMessage || "Upload failed, please try again.");
     setPopupType("error");
     setShowMessagePopup(true);
   } finally {
     setIsSubmitting(false);
+    setUploadStatus("");
   }
 };
 
@@ -392,6 +425,10 @@ return (
         </div>
       )}
 
+      {uploadStatus && (
+        <p className="text-center text-sm text-gray-300 animate-pulse">{uploadStatus}</p>
+      )}
+
       {/* Found item */}
       <button
         type="button"